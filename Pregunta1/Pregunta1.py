@@ -1,6 +1,26 @@
+import ast
 import asyncio
+import builtins
+import hashlib
+import itertools
 import logging
+import mmap
+import os
+import pickle
+import random
+import struct
+import sys
+import tempfile
 import threading
+import time
+import tracemalloc
+import types
+from array import array
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import Metrics
 
 # Configuración de logging para registrar información
 logging.basicConfig(level=logging.INFO)
@@ -13,66 +33,617 @@ class EventPriority:
 
 # Clase para representar eventos
 class Event:
+    __slots__ = ('type', 'priority', 'data', 'sequence', 'created', 'cancelled')
+    _sequence = itertools.count()  # Orden de llegada, para desempatar eventos de igual prioridad
+
     def __init__(self, event_type, priority, data):
         self.type = event_type
         self.priority = priority
         self.data = data
+        self.sequence = next(Event._sequence)
+        self.created = time.perf_counter()
+        self.cancelled = False  # Reemplazado por otro evento antes de despacharse
 
-    # Método para comparar eventos basándose en su prioridad
+    # Celda afectada si el evento admite fusión con otros pendientes, o None
+    def coalesce_key(self):
+        if self.type == 'execute_cell':
+            return (self.data, self.type)
+        if self.type in ('modify_cell', 'update_cell'):
+            return (self.data[0], self.type)
+        return None
+
+    # Método para comparar eventos basándose en su prioridad y, a igual prioridad, en su llegada
     def __lt__(self, other):
-        return self.priority < other.priority
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+# Nombres que indican que una celda accede al recurso compartido o al propio notebook
+# (estas celdas se ejecutan en el bucle de eventos: no pueden ir a otro proceso)
+SHARED_NAMES = frozenset({'shared_resource', 'update_shared_resource', 'notebook'})
+
+def touches_shared_resource(code):
+    # Revisa los nombres usados por el código (incluidas funciones anidadas)
+    if SHARED_NAMES.intersection(code.co_names):
+        return True
+    return any(touches_shared_resource(const) for const in code.co_consts
+               if isinstance(const, types.CodeType))
+
+# Nombres que el simulador inyecta en cada celda (no son dependencias entre celdas)
+INJECTED_NAMES = frozenset(dir(builtins)) | {'notebook', 'update_shared_resource'}
+
+def bound_names(nodes, arguments=None):
+    # Nombres que un bloque liga sin entrar en ámbitos anidados, y los que declara
+    # global o nonlocal (esos no son locales aunque se asignen)
+    bound, declared = set(), set()
+    if arguments is not None:
+        for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs:
+            bound.add(arg.arg)
+        for arg in (arguments.vararg, arguments.kwarg):
+            if arg is not None:
+                bound.add(arg.arg)
+    pending = list(nodes)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ast.Name):
+            if not isinstance(node.ctx, ast.Load):
+                bound.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+            continue
+        elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update((alias.asname or alias.name).split('.')[0] for alias in node.names)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            declared.update(node.names)
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+        pending.extend(ast.iter_child_nodes(node))
+    return bound, declared
+
+# Recorre la celda en el orden en que se ejecuta. En el nivel superior, un nombre leído
+# antes de que la celda lo asigne viene de otra celda; en funciones, clases, lambdas y
+# comprensiones, los nombres ligados en ese ámbito (parámetros, asignaciones, objetivos
+# de los for) son locales y solo los libres se buscan en otras celdas
+class NameAnalyzer(ast.NodeVisitor):
+    def __init__(self):
+        self.defines = set()
+        self.uses = set()  # Leídos en el nivel superior antes de definirse en la celda
+        self.free = set()  # Leídos desde ámbitos anidados sin ligarse en ninguno
+        self.scopes = []  # Nombres locales de los ámbitos anidados abiertos
+        self.class_scopes = []  # Por ámbito abierto, si es el cuerpo de una clase
+
+    def load(self, name):
+        # Los nombres de una clase solo se ven desde su propio cuerpo, no desde las
+        # funciones ni comprensiones que contiene
+        innermost = len(self.scopes) - 1
+        for depth, scope in enumerate(self.scopes):
+            if name in scope and (depth == innermost or not self.class_scopes[depth]):
+                return
+        if self.scopes:
+            self.free.add(name)
+        elif name not in self.defines:
+            self.uses.add(name)
+
+    def store(self, name):
+        if self.scopes:
+            self.scopes[-1].add(name)
+        else:
+            self.defines.add(name)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.load(node.id)
+        else:
+            self.store(node.id)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self.visit(target)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self.load(node.target.id)
+        self.visit(node.target)
+
+    def visit_AnnAssign(self, node):
+        self.visit(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.visit(node.target)
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.store((alias.asname or alias.name).split('.')[0])
+
+    visit_ImportFrom = visit_Import
+
+    def visit_ExceptHandler(self, node):
+        if node.type is not None:
+            self.visit(node.type)
+        if node.name:
+            self.store(node.name)
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_MatchAs(self, node):
+        if node.pattern is not None:
+            self.visit(node.pattern)
+        if node.name:
+            self.store(node.name)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.store(node.name)
+
+    def visit_MatchMapping(self, node):
+        for key in node.keys:
+            self.visit(key)
+        for pattern in node.patterns:
+            self.visit(pattern)
+        if node.rest:
+            self.store(node.rest)
+
+    def visit_scope(self, local, body, is_class=False):
+        self.scopes.append(local)
+        self.class_scopes.append(is_class)
+        for node in body:
+            self.visit(node)
+        self.scopes.pop()
+        self.class_scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        # Decoradores, valores por defecto y anotaciones se evalúan al definir la función
+        arguments = node.args
+        for expression in itertools.chain(node.decorator_list, arguments.defaults, arguments.kw_defaults):
+            if expression is not None:
+                self.visit(expression)
+        bound, declared = bound_names(node.body, arguments)
+        if not self.scopes:
+            self.defines.update(bound & declared)  # Asignadas con global al llamarla
+        self.store(node.name)
+        self.visit_scope(bound - declared, node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        for expression in itertools.chain(node.decorator_list, node.bases, node.keywords):
+            self.visit(expression)
+        bound, declared = bound_names(node.body)
+        self.visit_scope(bound - declared, node.body, is_class=True)
+        self.store(node.name)
+
+    def visit_Lambda(self, node):
+        arguments = node.args
+        for expression in itertools.chain(arguments.defaults, arguments.kw_defaults):
+            if expression is not None:
+                self.visit(expression)
+        self.visit_scope(bound_names((), arguments)[0], [node.body])
+
+    def visit_comprehension_scope(self, node, elements):
+        # El primer iterable se evalúa en el ámbito que contiene a la comprensión
+        generators = node.generators
+        self.visit(generators[0].iter)
+        local = set()
+        for generator in generators:
+            local |= bound_names([generator.target])[0]
+        self.visit_scope(local, [generator.iter for generator in generators[1:]]
+                         + [condition for generator in generators for condition in generator.ifs]
+                         + elements)
+
+    def visit_ListComp(self, node):
+        self.visit_comprehension_scope(node, [node.elt])
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self.visit_comprehension_scope(node, [node.key, node.value])
+
+def analyze_cell(tree):
+    # Nombres que la celda define y nombres que lee de otras celdas (incluidos los que
+    # lee antes de reasignarlos, como en x = x + 1)
+    analyzer = NameAnalyzer()
+    analyzer.visit(tree)
+    uses = analyzer.uses | (analyzer.free - analyzer.defines)
+    return frozenset(analyzer.defines), frozenset(uses - INJECTED_NAMES)
+
+# Resultado de compilar una celda: código, si toca el recurso compartido y sus nombres
+CompiledCell = namedtuple('CompiledCell', 'code shared defines uses portable')
+
+# Tipos de nodo que crean valores que no se pueden enviar entre procesos (funciones y
+# clases de la celda, módulos importados)
+LOCAL_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda, ast.Import, ast.ImportFrom)
+
+def is_portable(tree):
+    # Indica si la celda puede ejecutarse en otro proceso y devolver lo que define
+    return not any(isinstance(node, LOCAL_NODES) for node in ast.walk(tree))
+
+# Caché LRU de objetos de código compilados, indexada por el hash del contenido de la celda
+class CodeCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # hash -> CompiledCell
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source):
+        return hashlib.blake2b(source.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, source):
+        # Devuelve el CompiledCell de la celda; el AST se analiza una sola vez por contenido
+        key = self.key(source)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        tree = ast.parse(source, '<cell>')
+        code = compile(tree, '<cell>', 'exec')
+        entry = self.entries[key] = CompiledCell(code, touches_shared_resource(code), *analyze_cell(tree),
+                                                     is_portable(tree))
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, source):
+        self.entries.pop(self.key(source), None)
+
+# Caché propia de cada proceso trabajador en el modo 'process'
+_worker_cache = CodeCache()
+
+def picklable(value):
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+    return True
+
+def _run_cell_source(source, cell_index, inputs):
+    # Ejecuta una celda en un proceso trabajador con un espacio de nombres nuevo y
+    # devuelve los nombres que define cuyo valor puede volver al proceso principal,
+    # junto con los que no pueden (p. ej. generadores o archivos abiertos)
+    namespace = {'__name__': f'cell_{cell_index}'}
+    namespace.update(inputs)
+    exec(_worker_cache.get(source).code, namespace)
+    results, dropped = {}, []
+    for name, value in namespace.items():
+        if name.startswith('__'):
+            continue
+        if picklable(value):
+            results[name] = value
+        else:
+            dropped.append(name)
+    return results, dropped
+
+# Almacén persistente de celdas: archivo de datos de solo anexado, leído mediante mmap,
+# más un índice (desplazamiento, longitud) por celda en un archivo aparte
+class CellStore:
+    RECORD = struct.Struct('<II')  # índice de celda, longitud del contenido en bytes
+    INDEX_HEADER = struct.Struct('<QQQ')  # tamaño de datos indexado, número de celdas, bytes obsoletos
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.offsets = array('q')
+        self.lengths = array('I')
+        self.garbage = 0  # Bytes ocupados por versiones antiguas de celdas modificadas
+        self.map = None
+        self.open_data()
+        if not self.load_index():
+            self.rebuild_index()
+
+    def open_data(self):
+        self.file = open(self.path, 'a+b')  # Las escrituras siempre van al final
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.mapped = 0
+
+    def load_index(self):
+        # Carga el índice si corresponde al archivo de datos actual
+        try:
+            with open(self.index_path, 'rb') as index:
+                size, count, garbage = self.INDEX_HEADER.unpack(index.read(self.INDEX_HEADER.size))
+                if size != self.size:
+                    return False
+                self.offsets.fromfile(index, count)
+                self.lengths.fromfile(index, count)
+        except (OSError, EOFError, struct.error):
+            self.offsets = array('q')
+            self.lengths = array('I')
+            return False
+        self.garbage = garbage
+        return True
+
+    def rebuild_index(self):
+        # Recorre las cabeceras del archivo de datos; la última versión de cada celda gana
+        self.offsets = array('q')
+        self.lengths = array('I')
+        self.garbage = 0
+        if self.size == 0:
+            return
+        self.remap()
+        offset = 0
+        while offset < self.size:
+            cell_index, length = self.RECORD.unpack_from(self.map, offset)
+            offset += self.RECORD.size
+            if cell_index < len(self.offsets):
+                self.garbage += self.RECORD.size + self.lengths[cell_index]
+                self.offsets[cell_index] = offset
+                self.lengths[cell_index] = length
+            else:
+                self.offsets.append(offset)
+                self.lengths.append(length)
+            offset += length
+
+    def remap(self):
+        self.file.flush()
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        self.mapped = self.size
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, cell_index):
+        # Lectura diferida: solo se decodifica (y pagina) la celda pedida
+        if not 0 <= cell_index < len(self.offsets):
+            raise IndexError(cell_index)
+        offset = self.offsets[cell_index]
+        end = offset + self.lengths[cell_index]
+        if end > self.mapped:
+            self.remap()
+        return self.map[offset:end].decode('utf-8')
+
+    def __iter__(self):
+        for cell_index in range(len(self.offsets)):
+            yield self[cell_index]
+
+    def write(self, cell_index, content):
+        data = content.encode('utf-8')
+        self.file.write(self.RECORD.pack(cell_index, len(data)) + data)
+        offset = self.size + self.RECORD.size
+        self.size = offset + len(data)
+        return offset, len(data)
+
+    def append(self, content):
+        offset, length = self.write(len(self.offsets), content)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def __setitem__(self, cell_index, content):
+        # Escribe una nueva versión; la anterior queda como basura hasta compactar
+        if not 0 <= cell_index < len(self.offsets):
+            raise IndexError(cell_index)
+        self.garbage += self.RECORD.size + self.lengths[cell_index]
+        self.offsets[cell_index], self.lengths[cell_index] = self.write(cell_index, content)
+
+    def flush(self):
+        # Guarda los datos y reescribe el índice de forma atómica
+        self.file.flush()
+        temporary = self.index_path + '.tmp'
+        with open(temporary, 'wb') as index:
+            index.write(self.INDEX_HEADER.pack(self.size, len(self.offsets), self.garbage))
+            self.offsets.tofile(index)
+            self.lengths.tofile(index)
+        os.replace(temporary, self.index_path)
+
+    def compact(self):
+        # Reescribe solo la versión vigente de cada celda
+        temporary = self.path + '.compact'
+        offsets = array('q')
+        with open(temporary, 'wb') as output:
+            position = 0
+            for cell_index, content in enumerate(self):
+                data = content.encode('utf-8')
+                output.write(self.RECORD.pack(cell_index, len(data)) + data)
+                offsets.append(position + self.RECORD.size)
+                position += self.RECORD.size + len(data)
+        self.close_files()
+        os.replace(temporary, self.path)
+        self.open_data()
+        self.offsets = offsets
+        self.garbage = 0
+        self.flush()
+
+    def close_files(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def close(self):
+        # Compacta si las versiones antiguas ocupan más que las vigentes
+        if self.garbage > self.size - self.garbage:
+            self.compact()
+        else:
+            self.flush()
+        self.close_files()
 
 # Simulador de Jupyter Notebook
 class NotebookSimulator:
-    def __init__(self):
-        self.cells = []  # Lista para almacenar celdas
-        self.event_queue = asyncio.PriorityQueue()  # Cola de eventos priorizada
+    def __init__(self, executor=None, max_workers=None, cache_size=1024,
+                 num_workers=1, queue_size=0, track_latency=False, coalesce=True,
+                 store_path=None, verbose=True, metrics=None):
+        self.verbose = verbose  # Con False se omiten los mensajes informativos por evento
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Lista para almacenar celdas, o un CellStore persistente si se indica store_path
+        self.cells = [] if store_path is None else CellStore(store_path)
+        # Cola de eventos priorizada; con queue_size > 0 add_event espera si está llena
+        self.event_queue = asyncio.PriorityQueue(queue_size)
+        self.num_workers = num_workers  # Corrutinas que consumen eventos en paralelo
+        self.cell_locks = defaultdict(asyncio.Lock)  # Orden de los eventos sobre una misma celda
+        self.running = {}  # celda -> asyncio.Event de los eventos en curso sobre ella
+        self.latencies = defaultdict(list) if track_latency else None  # Por prioridad
+        self.events_processed = 0
+        self.coalesce = coalesce
+        self.pending_events = {}  # (celda, tipo) -> evento aún no despachado
+        self.queue_operations = 0
+        self.events_coalesced = 0
         self.shared_resource = 0  # Recurso compartido
-        self.resource_lock = threading.Lock()  # Bloqueo para acceso seguro a recursos compartidos
+        # Reentrante: una celda serializada puede llamar a update_shared_resource
+        self.resource_lock = threading.RLock()  # Bloqueo para acceso seguro a recursos compartidos
+        self.code_cache = CodeCache(cache_size)
+        self.local_cells = set()  # Celdas que en modo 'process' se ejecutan en este proceso
+        self.namespaces = {}  # Espacio de nombres propio de cada celda
+        self.graph = None  # Grafo de dependencias entre celdas; None = hay que reconstruirlo
+        self.analyzed = {}  # celda -> (nombres que define, nombres que lee), solo celdas consultadas
+        self.upstream = {}  # celda -> {nombre: celda que lo define}, resuelto bajo demanda
+        self.undefined = {}  # nombre -> n: ninguna celda anterior a la n lo define
+        # Modo de ejecución: None (en el bucle de eventos), 'thread' o 'process'
+        self.executor_mode = executor
+        if executor == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers)
+        elif executor == 'process':
+            self.executor = ProcessPoolExecutor(max_workers)
+        elif executor is None:
+            self.executor = None
+        else:
+            raise ValueError(f"Unknown executor mode: {executor}")
 
-    # Método principal para ejecutar el simulador
-    async def run(self):
-        event_handler_task = asyncio.create_task(self.event_handler())
-        
-        # Simular algunos eventos con diferentes prioridades
-        await self.add_event('add_cell', EventPriority.HIGH, 'print("Hello, World!")')
-        await self.add_event('execute_cell', EventPriority.MEDIUM, 0)
-        await self.add_event('modify_cell', EventPriority.LOW, (0, 'print("Modified cell")'))
-        await self.add_event('execute_cell', EventPriority.MEDIUM, 0)
+    # Método principal para ejecutar el simulador; events es una lista opcional de
+    # (tipo, prioridad, datos) que reemplaza a los eventos de demostración
+    async def run(self, events=None):
+        event_handler_tasks = self.start_workers()
+
+        if events is not None:
+            await self.add_events(events)
+        else:
+            # Simular algunos eventos con diferentes prioridades
+            await self.add_event('add_cell', EventPriority.HIGH, 'print("Hello, World!")')
+            await self.add_event('execute_cell', EventPriority.MEDIUM, 0)
+            await self.add_event('modify_cell', EventPriority.LOW, (0, 'print("Modified cell")'))
+            await self.add_event('execute_cell', EventPriority.MEDIUM, 0)
         
         await self.event_queue.join()  # Esperar a que se procesen todos los eventos
-        event_handler_task.cancel()  # Cancelar el manejador de eventos
-        try:
-            await event_handler_task
-        except asyncio.CancelledError:
+        await self.stop_workers(event_handler_tasks)
+
+    def start_workers(self):
+        # Crea las corrutinas consumidoras de la cola de eventos
+        return [asyncio.create_task(self.event_handler()) for _ in range(self.num_workers)]
+
+    async def stop_workers(self, tasks):
+        for task in tasks:
+            task.cancel()  # Cancelar el manejador de eventos
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.verbose:
             logging.info("Event handler task cancelled")
 
     # Método para añadir eventos a la cola
     async def add_event(self, event_type, priority, data):
-        event = Event(event_type, priority, data)
-        await self.event_queue.put(event)
+        await self.add_events([(event_type, priority, data)])
+
+    # Añade un lote de eventos (tipo, prioridad, datos). Las modificaciones pendientes de
+    # una misma celda se fusionan (gana el contenido más reciente) y las ejecuciones
+    # repetidas de una celda que ya espera ejecutarse se descartan, salvo que entre
+    # ambas se haya encolado una modificación: el contenido nuevo debe ejecutarse
+    async def add_events(self, batch):
+        queued = []
+        for event_type, priority, data in batch:
+            event = Event(event_type, priority, data)
+            key = event.coalesce_key() if self.coalesce else None
+            pending = self.pending_events.get(key) if key is not None else None
+            if pending is not None:
+                self.events_coalesced += 1
+                if priority >= pending.priority:
+                    pending.data = data  # Se reutiliza el evento ya encolado
+                    continue
+                pending.cancelled = True  # La nueva versión tiene más prioridad: reemplaza a la anterior
+            if key is not None:
+                self.pending_events[key] = event
+                if event_type != 'execute_cell':
+                    # La ejecución pendiente es anterior a esta modificación: no admite más fusiones
+                    self.pending_events.pop((key[0], 'execute_cell'), None)
+            queued.append(event)
+        for event in queued:
+            await self.event_queue.put(event)
+        self.queue_operations += len(queued)
 
     # Manejador de eventos
     async def event_handler(self):
         while True:
             try:
                 event = await self.event_queue.get()
-                await self.process_event(event)
-                self.event_queue.task_done()
+                if event.cancelled:
+                    self.event_queue.task_done()
+                    continue
+                key = event.coalesce_key()
+                if key is not None and self.pending_events.get(key) is event:
+                    del self.pending_events[key]  # Desde aquí ya no admite fusiones
+                # Antes de ceder el control: eventos en curso que deben terminar antes que este
+                previous = [done for cell in self.blocking_cells(event) for done in self.running.get(cell, ())]
+                done = None
+                if key is not None:
+                    done = asyncio.Event()
+                    self.running.setdefault(key[0], []).append(done)
+                try:
+                    for finished in previous:
+                        await finished.wait()
+                    await self.process_event(event)
+                finally:
+                    if done is not None:
+                        done.set()
+                        running = self.running[key[0]]
+                        running.remove(done)
+                        if not running:
+                            del self.running[key[0]]
+                    self.event_queue.task_done()
+                self.events_processed += 1
+                latency = time.perf_counter() - event.created
+                self.metrics.observe('event_latency_seconds', latency)
+                if self.latencies is not None:
+                    self.latencies[event.priority].append(latency)
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logging.error(f"Error processing event: {e}")
 
+    # Celdas cuyos eventos en curso deben terminar antes de procesar este: la propia
+    # celda y, si el evento la ejecuta, las celdas de las que depende. Los eventos aún
+    # en la cola no se esperan: su orden lo decide la prioridad
+    def blocking_cells(self, event):
+        key = event.coalesce_key()
+        if key is None or not self.running:
+            return ()
+        cell = key[0]
+        if event.type == 'modify_cell' or not 0 <= cell < len(self.cells):
+            return (cell,)
+        return {cell, *self.upstream_cells(cell).values()}
+
     # Procesador de eventos
     async def process_event(self, event):
         try:
             if event.type == 'add_cell':
                 await self.add_cell(event.data)
             elif event.type == 'execute_cell':
-                await self.execute_cell(event.data)
+                # El lock se toma sin ceder el control tras sacar el evento de la cola, así
+                # los eventos de una misma celda se procesan en el orden de la cola
+                async with self.cell_locks[event.data]:
+                    await self.execute_cell(event.data)
             elif event.type == 'modify_cell':
-                await self.modify_cell(*event.data)
+                async with self.cell_locks[event.data[0]]:
+                    await self.modify_cell(*event.data)
+            elif event.type == 'update_cell':
+                # Modifica la celda y re-ejecuta solo ella y sus dependientes
+                async with self.cell_locks[event.data[0]]:
+                    await self.modify_cell(*event.data)
+                    await self.rerun_dependents(event.data[0])
             else:
                 logging.warning(f"Unknown event type: {event.type}")
         except Exception as e:
@@ -81,41 +652,364 @@ class NotebookSimulator:
     # Método para añadir una celda
     async def add_cell(self, content):
         self.cells.append(content)
-        logging.info(f"Added cell: {content}")
+        self.graph = None
+        if self.verbose:
+            logging.info(f"Added cell: {content}")
 
     # Método para ejecutar una celda
     async def execute_cell(self, cell_index):
         if 0 <= cell_index < len(self.cells):
             cell_content = self.cells[cell_index]
-            logging.info(f"Executing cell {cell_index}: {cell_content}")
+            if self.verbose:
+                logging.info(f"Executing cell {cell_index}: {cell_content}")
+            inicio = time.perf_counter()
             try:
-                await asyncio.sleep(1)  # Simular ejecución asíncrona
-                with self.resource_lock:
-                    exec(cell_content)
+                code, shared, _, uses, portable = self.code_cache.get(cell_content)
+                # Solo se consulta el grafo (que recorre todas las celdas) si la celda lee nombres
+                inputs = self.cell_inputs(cell_index) if uses else {}
+                local = self.executor_mode == 'process' and (
+                    not portable or cell_index in self.local_cells or not picklable(inputs))
+                if self.executor is None or shared or local:
+                    # Las celdas que tocan el recurso compartido se ejecutan serializadas aquí, y
+                    # en modo 'process' también las que definen o leen valores que no cruzan
+                    # procesos (funciones, módulos, generadores...)
+                    self.run_cell(cell_index, code, shared, inputs)
+                elif self.executor_mode == 'thread':
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self.run_cell, cell_index, code, False, inputs)
+                else:
+                    results, dropped = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, _run_cell_source, cell_content, cell_index, inputs)
+                    if dropped:
+                        # Sin esos valores las celdas dependientes fallarían: se repite aquí
+                        # y la celda ya no se envía a otro proceso
+                        logging.warning(f"Cell {cell_index} defines values that cannot leave the "
+                                        f"worker process ({', '.join(dropped)}); re-running it locally")
+                        self.local_cells.add(cell_index)
+                        self.run_cell(cell_index, code, False, inputs)
+                    else:
+                        self.cell_namespace(cell_index).update(results)
             except Exception as e:
+                self.metrics.inc('cell_errors')
                 logging.error(f"Error executing cell {cell_index}: {e}")
+            self.metrics.inc('cells_executed')
+            self.metrics.observe('cell_execution_seconds', time.perf_counter() - inicio)
         else:
             logging.error(f"Invalid cell index: {cell_index}")
 
+    # Ejecuta de forma concurrente varias celdas
+    async def execute_cells(self, cell_indices):
+        await asyncio.gather(*(self.execute_cell(i) for i in cell_indices))
+
+    def cell_namespace(self, cell_index):
+        namespace = self.namespaces.get(cell_index)
+        if namespace is None:
+            namespace = self.namespaces[cell_index] = {
+                '__name__': f'cell_{cell_index}',
+                'notebook': self,
+                'update_shared_resource': self.update_shared_resource,
+            }
+        return namespace
+
+    def dependency_graph(self):
+        # Construye (una vez por cambio) el DAG de celdas: cada nombre que lee una celda
+        # proviene de la última celda anterior que lo define
+        if self.graph is None:
+            upstream = [dict() for _ in range(len(self.cells))]  # celda -> {nombre: celda que lo define}
+            downstream = [set() for _ in range(len(self.cells))]
+            last_definer = {}
+            for index in range(len(self.cells)):
+                defines, uses = self.cell_names(index)
+                for name in uses:
+                    definer = last_definer.get(name)
+                    if definer is not None:
+                        upstream[index][name] = definer
+                        downstream[definer].add(index)
+                for name in defines:
+                    last_definer[name] = index
+            self.graph = (upstream, downstream)
+        return self.graph
+
+    def cell_names(self, cell_index):
+        # (nombres que define, nombres que lee) de una celda; sin compilarla
+        names = self.analyzed.get(cell_index)
+        if names is None:
+            try:
+                names = analyze_cell(ast.parse(self.cells[cell_index], '<cell>'))
+            except SyntaxError:
+                names = (frozenset(), frozenset())
+            self.analyzed[cell_index] = names
+        return names
+
+    def upstream_cells(self, cell_index):
+        # {nombre: celda que lo define} para los nombres que lee la celda. Sin el grafo
+        # completo se analizan hacia atrás solo las celdas necesarias hasta encontrar
+        # quién define cada nombre: ejecutar una celda de un CellStore grande no recorre
+        # todo el notebook
+        if self.graph is not None:
+            return self.graph[0][cell_index]
+        upstream = self.upstream.get(cell_index)
+        if upstream is None:
+            upstream = self.upstream[cell_index] = {}
+            undefined = self.undefined
+            missing = set(self.cell_names(cell_index)[1])
+            unresolved = set()
+            index = cell_index - 1
+            while missing and index >= 0:
+                defines = self.cell_names(index)[0]
+                for name in list(missing):
+                    if name in defines:
+                        upstream[name] = index
+                        missing.discard(name)
+                    elif index < undefined.get(name, 0):
+                        unresolved.add(name)  # Ya se sabe que no hay definiciones más abajo
+                        missing.discard(name)
+                index -= 1
+            for name in missing | unresolved:
+                undefined[name] = max(undefined.get(name, 0), cell_index)
+        return upstream
+
+    def same_names(self, old_content, new_content):
+        # Una edición que no cambia los nombres definidos ni leídos conserva el grafo
+        try:
+            old = self.code_cache.get(old_content)
+            new = self.code_cache.get(new_content)
+        except SyntaxError:
+            return False
+        return old.defines == new.defines and old.uses == new.uses
+
+    def cell_inputs(self, cell_index):
+        # Valores que la celda lee de los espacios de nombres de las celdas de las que depende
+        inputs = {}
+        for name, definer in self.upstream_cells(cell_index).items():
+            namespace = self.namespaces.get(definer)
+            if namespace is not None and name in namespace:
+                inputs[name] = namespace[name]
+        return inputs
+
+    def downstream_cells(self, cell_index):
+        # La celda y todas las que dependen de ella, directa o indirectamente
+        _, downstream = self.dependency_graph()
+        affected = {cell_index}
+        pending = [cell_index]
+        while pending:
+            for dependent in downstream[pending.pop()]:
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+        return affected
+
+    # Re-ejecuta una celda y sus dependientes en orden topológico; las ramas
+    # independientes avanzan en paralelo
+    async def rerun_dependents(self, cell_index):
+        if not 0 <= cell_index < len(self.cells):
+            logging.error(f"Invalid cell index: {cell_index}")
+            return
+        affected = self.downstream_cells(cell_index)
+        upstream, _ = self.dependency_graph()
+        done = {index: asyncio.Event() for index in affected}
+
+        async def rerun(index):
+            for definer in set(upstream[index].values()):
+                if definer in done:
+                    await done[definer].wait()
+            if index == cell_index:
+                await self.execute_cell(index)
+            else:
+                async with self.cell_locks[index]:
+                    await self.execute_cell(index)
+            done[index].set()
+
+        await asyncio.gather(*(rerun(index) for index in sorted(affected)))
+        return affected
+
+    def run_cell(self, cell_index, code, shared, inputs=None):
+        # Ejecuta el código compilado en el espacio de nombres de la celda
+        namespace = self.cell_namespace(cell_index)
+        if inputs:
+            namespace.update(inputs)
+        if shared:
+            with self.resource_lock:
+                exec(code, namespace)
+        else:
+            exec(code, namespace)
+
     # Método para modificar una celda
     async def modify_cell(self, cell_index, new_content):
         if 0 <= cell_index < len(self.cells):
+            old_content = self.cells[cell_index]
             self.cells[cell_index] = new_content
-            logging.info(f"Modified cell {cell_index}: {new_content}")
+            if not self.same_names(old_content, new_content):
+                self.graph = None
+                self.analyzed.pop(cell_index, None)
+                self.upstream.clear()
+                self.undefined.clear()
+            self.code_cache.invalidate(old_content)
+            self.namespaces.pop(cell_index, None)
+            self.local_cells.discard(cell_index)
+            if self.verbose:
+                logging.info(f"Modified cell {cell_index}: {new_content}")
         else:
             logging.error(f"Invalid cell index: {cell_index}")
 
+    def close(self):
+        # Libera el pool de ejecución y guarda el almacén de celdas
+        if self.executor is not None:
+            self.executor.shutdown()
+        if isinstance(self.cells, CellStore):
+            self.cells.close()
+
     # Método para actualizar un recurso compartido de forma segura
     def update_shared_resource(self, value):
         with self.resource_lock:
             self.shared_resource += value
-            logging.info(f"Updated shared resource: {self.shared_resource}")
+            if self.verbose:
+                logging.info(f"Updated shared resource: {self.shared_resource}")
+
+# Mide la re-ejecución de un notebook: la primera pasada compila, las siguientes usan la caché
+async def benchmark_notebook(num_celdas=500, repeticiones=5, executor=None):
+    logging.disable(logging.INFO)
+    notebook = NotebookSimulator(executor)
+    for i in range(num_celdas):
+        await notebook.add_cell(f"total = 0\nfor i in range({i % 50}):\n    total += i * {i}\n")
+    for repeticion in range(repeticiones):
+        inicio = time.perf_counter()
+        await notebook.execute_cells(range(num_celdas))
+        duracion = time.perf_counter() - inicio
+        print(f"Pasada {repeticion + 1}: {duracion * 1e3:.1f} ms "
+              f"(aciertos de caché: {notebook.code_cache.hits}, compilaciones: {notebook.code_cache.misses})")
+    notebook.close()
+    logging.disable(logging.NOTSET)
+
+# Generador de carga: mide el rendimiento y la latencia p99 de cada clase de prioridad
+async def generar_carga(num_eventos=20000, num_celdas=100, num_workers=4, queue_size=256,
+                        executor=None, coalesce=False, seed=0):
+    logging.disable(logging.INFO)
+    rng = random.Random(seed)
+    notebook = NotebookSimulator(executor, num_workers=num_workers, queue_size=queue_size,
+                                 track_latency=True, coalesce=coalesce)
+    for i in range(num_celdas):
+        await notebook.add_cell(f"x = sum(range({i % 20}))")
+    workers = notebook.start_workers()
+    prioridades = [EventPriority.HIGH, EventPriority.MEDIUM, EventPriority.LOW]
+    inicio = time.perf_counter()
+    for _ in range(num_eventos):
+        celda = rng.randrange(num_celdas)
+        prioridad = rng.choice(prioridades)
+        if rng.random() < 0.2:
+            await notebook.add_event('modify_cell', prioridad, (celda, f"x = {celda} * 2"))
+        else:
+            await notebook.add_event('execute_cell', prioridad, celda)
+    await notebook.event_queue.join()
+    duracion = time.perf_counter() - inicio
+    await notebook.stop_workers(workers)
+    notebook.close()
+    logging.disable(logging.NOTSET)
+    print(f"Workers: {num_workers}, capacidad de la cola: {queue_size}, "
+          f"eventos por segundo: {notebook.events_processed / duracion:.0f}")
+    for prioridad in prioridades:
+        latencias = sorted(notebook.latencies[prioridad])
+        p99 = latencias[int(len(latencias) * 0.99)] if latencias else 0.0
+        print(f"  Prioridad {prioridad}: {len(latencias)} eventos, latencia p99: {p99 * 1e3:.2f} ms")
+
+# Simula un editor que envía una modificación por pulsación de tecla y mide las
+# operaciones de cola con y sin fusión de eventos
+async def benchmark_fusion(num_celdas=50, pulsaciones=200, lote=20):
+    logging.disable(logging.INFO)
+    for coalesce in (False, True):
+        notebook = NotebookSimulator(coalesce=coalesce)
+        for i in range(num_celdas):
+            await notebook.add_cell(f"x{i} = 0")
+        workers = notebook.start_workers()
+        inicio = time.perf_counter()
+        for inicio_lote in range(0, pulsaciones, lote):
+            eventos = []
+            for tecla in range(inicio_lote, inicio_lote + lote):
+                for i in range(num_celdas):
+                    eventos.append(('modify_cell', EventPriority.LOW, (i, f"x{i} = {tecla}")))
+                    eventos.append(('execute_cell', EventPriority.LOW, i))
+            await notebook.add_events(eventos)
+            await asyncio.sleep(0)
+        await notebook.event_queue.join()
+        duracion = time.perf_counter() - inicio
+        await notebook.stop_workers(workers)
+        print(f"Fusión {'activada' if coalesce else 'desactivada'}: "
+              f"{notebook.queue_operations} operaciones de cola, "
+              f"{notebook.events_processed} eventos procesados, {duracion * 1e3:.1f} ms")
+    logging.disable(logging.NOTSET)
+
+# Compara re-ejecutar todo el notebook frente a re-ejecutar solo los dependientes de una edición
+async def benchmark_dependencias(num_ramas=50, celdas_por_rama=10):
+    logging.disable(logging.INFO)
+    notebook = NotebookSimulator()
+    for rama in range(num_ramas):
+        await notebook.add_cell(f"r{rama}_0 = {rama}")
+        for paso in range(1, celdas_por_rama):
+            await notebook.add_cell(f"r{rama}_{paso} = sum(range(1000)) + r{rama}_{paso - 1} % 7")
+    total = len(notebook.cells)
+    inicio = time.perf_counter()
+    await notebook.execute_cells(range(total))
+    completo = time.perf_counter() - inicio
+    await notebook.modify_cell(celdas_por_rama // 2, "r0_5 = 1")
+    inicio = time.perf_counter()
+    afectadas = await notebook.rerun_dependents(celdas_por_rama // 2)
+    incremental = time.perf_counter() - inicio
+    logging.disable(logging.NOTSET)
+    print(f"Celdas: {total}, re-ejecución completa: {completo * 1e3:.1f} ms, "
+          f"incremental: {len(afectadas)} celdas en {incremental * 1e3:.1f} ms")
+
+# Abre un notebook persistente de num_celdas celdas y ejecuta unas pocas: mide el
+# tiempo de apertura y la memoria de Python asignada frente a cargarlo entero en una lista
+async def benchmark_almacen(num_celdas=100000, ejecutadas=100):
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'notebook.cells')
+        notebook = NotebookSimulator(store_path=ruta)
+        for i in range(num_celdas):
+            notebook.cells.append(f"x{i} = {i} * 2  # celda {i}")
+        notebook.close()
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        notebook = NotebookSimulator(store_path=ruta)
+        apertura = time.perf_counter() - inicio
+        await notebook.execute_cells(range(0, num_celdas, num_celdas // ejecutadas))
+        memoria, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        notebook.close()
+        print(f"Almacén: apertura de {num_celdas} celdas en {apertura * 1e3:.1f} ms, "
+              f"memoria tras ejecutar {ejecutadas}: {memoria / 1024:.0f} KiB")
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        with open(ruta, 'rb') as datos:
+            contenido = datos.read()
+        celdas, offset = [], 0
+        while offset < len(contenido):
+            _, longitud = CellStore.RECORD.unpack_from(contenido, offset)
+            offset += CellStore.RECORD.size
+            celdas.append(contenido[offset:offset + longitud].decode('utf-8'))
+            offset += longitud
+        carga = time.perf_counter() - inicio
+        memoria, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"Lista en memoria: carga en {carga * 1e3:.1f} ms, memoria: {memoria / 1024:.0f} KiB")
+    logging.disable(logging.NOTSET)
 
 # Función principal asíncrona
 async def main():
     notebook = NotebookSimulator()
     await notebook.run()
+    notebook.close()
 
 # Punto de entrada del programa
 if __name__ == "__main__":
-    asyncio.run(main())
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        asyncio.run(benchmark_notebook())
+        asyncio.run(benchmark_notebook(executor='thread'))
+        asyncio.run(generar_carga())
+        asyncio.run(benchmark_dependencias())
+        asyncio.run(benchmark_fusion())
+        asyncio.run(benchmark_almacen())
+    else:
+        asyncio.run(main())
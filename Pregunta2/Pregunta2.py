@@ -1,113 +1,772 @@
+import bisect
+import contextlib
+import mmap
+import os
+import queue
 import random
-from collections import defaultdict
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import defaultdict, deque
+from itertools import chain
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import Metrics
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se usa un respaldo con listas de Python
+    np = None
+
+# Almacén contiguo con los relojes vectoriales de todos los robots (matriz N x N)
+class VectorClockStore:
+    def __init__(self, num_processes, num_rows=None):
+        self.num_processes = num_processes
+        self.num_rows = num_processes if num_rows is None else num_rows
+        if np is not None:
+            self.matrix = np.zeros((self.num_rows, num_processes), dtype=np.int64)
+        else:
+            self.matrix = [[0] * num_processes for _ in range(self.num_rows)]
+
+    def row(self, row):
+        # Devuelve una vista (sin copia) del reloj almacenado en la fila indicada
+        return self.matrix[row]
+
+    def tick(self, row, column=None):
+        # Incrementa la entrada local del reloj de la fila indicada
+        column = row if column is None else column
+        self.matrix[row][column] += 1
+
+    def tick_many(self, rows):
+        # Incrementa la entrada local de varios relojes a la vez (fila == proceso)
+        if np is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            np.add.at(self.matrix, (rows, rows), 1)
+        else:
+            for row in rows:
+                self.matrix[row][row] += 1
+
+    def merge(self, row, other_clock, column=None):
+        # Máximo componente a componente con otro reloj y tick local, en el sitio
+        target = self.matrix[row]
+        if np is not None:
+            np.maximum(target, other_clock, out=target)
+        else:
+            target[:] = map(max, target, other_clock)
+        self.tick(row, column)
+
+    def merge_batch(self, receivers, senders):
+        # Aplica muchos mensajes a la vez: receivers[k] recibe el reloj de senders[k].
+        # Los relojes de los emisores se toman antes de aplicar el lote; como un
+        # emisor nunca conoce más eventos del receptor que el propio receptor,
+        # el resultado equivale a aplicar los mensajes uno por uno siempre que ningún
+        # receptor del lote sea también emisor. Si lo es, se aplican en orden.
+        if not set(receivers).isdisjoint(senders):
+            for receiver, sender in zip(receivers, senders):
+                self.merge(receiver, self.matrix[sender])
+            return
+        if np is not None:
+            receivers = np.asarray(receivers, dtype=np.intp)
+            clocks = self.matrix[np.asarray(senders, dtype=np.intp)]
+            np.maximum.at(self.matrix, receivers, clocks)
+            np.add.at(self.matrix, (receivers, receivers), 1)
+        else:
+            clocks = [list(self.matrix[sender]) for sender in senders]
+            for receiver, clock in zip(receivers, clocks):
+                target = self.matrix[receiver]
+                target[:] = map(max, target, clock)
+                target[receiver] += 1
+
+    @staticmethod
+    def compare(clock_a, clock_b):
+        # Compara dos relojes: 'before', 'after', 'equal' o 'concurrent'
+        if np is not None:
+            clock_a = np.asarray(clock_a)
+            clock_b = np.asarray(clock_b)
+            less = bool((clock_a < clock_b).any())
+            greater = bool((clock_a > clock_b).any())
+        else:
+            less = any(a < b for a, b in zip(clock_a, clock_b))
+            greater = any(a > b for a, b in zip(clock_a, clock_b))
+        if less and greater:
+            return 'concurrent'
+        if less:
+            return 'before'
+        if greater:
+            return 'after'
+        return 'equal'
+
+    def happens_before(self, row_a, row_b):
+        # Indica si el último evento de row_a precede causalmente al de row_b
+        return self.compare(self.matrix[row_a], self.matrix[row_b]) == 'before'
+
+    def concurrent(self, row_a, row_b):
+        # Indica si los relojes de ambas filas son concurrentes
+        return self.compare(self.matrix[row_a], self.matrix[row_b]) == 'concurrent'
+
+    @staticmethod
+    def sparse(clock):
+        # Índices y valores de las entradas no nulas de un reloj
+        if isinstance(clock, dict):
+            indices = sorted(clock)
+            return indices, [clock[i] for i in indices]
+        if np is not None and hasattr(clock, 'tolist'):
+            indices = np.flatnonzero(clock)
+            return indices.tolist(), clock[indices].tolist()
+        indices = [i for i, value in enumerate(clock) if value]
+        return indices, [int(clock[i]) for i in indices]
+
+    @staticmethod
+    def to_list(clock):
+        # Copia un reloj (vista o lista) a una lista de enteros de Python
+        return clock.tolist() if hasattr(clock, 'tolist') else list(clock)
 
 # Implementación de relojes vectoriales para ordenamiento parcial de eventos
 class VectorClock:
-    def __init__(self, num_processes, process_id):
-        self.clock = [0] * num_processes
+    def __init__(self, num_processes, process_id, store=None):
+        # Sin almacén compartido, el reloj usa un almacén propio de una sola fila
+        if store is None:
+            store = VectorClockStore(num_processes, num_rows=1)
+            self.row = 0
+        else:
+            self.row = process_id
+        self.store = store
         self.process_id = process_id
 
+    @property
+    def clock(self):
+        # Vista del reloj dentro del almacén (no es una copia)
+        return self.store.row(self.row)
+
     def tick(self):
         # Incrementa el tiempo local del proceso
-        self.clock[self.process_id] += 1
+        self.store.tick(self.row, self.process_id)
 
     def update(self, other_clock):
         # Actualiza el reloj con información de otro proceso
-        for i in range(len(self.clock)):
-            self.clock[i] = max(self.clock[i], other_clock[i])
+        self.store.merge(self.row, other_clock, self.process_id)
+
+    def message_for(self, receiver_id):
+        # Carga útil de un mensaje: el reloj completo
+        return self.clock
+
+    def compare(self, other):
+        # Compara este reloj con otro VectorClock (o con un SparseVectorClock)
+        other_clock = other.clock
+        if isinstance(other_clock, dict):
+            return SparseVectorClock.compare_sparse(dict(zip(*VectorClockStore.sparse(self.clock))),
+                                                    other_clock)
+        return VectorClockStore.compare(self.clock, other_clock)
+
+    def happens_before(self, other):
+        return self.compare(other) == 'before'
+
+    def concurrent_with(self, other):
+        return self.compare(other) == 'concurrent'
+
+    def __str__(self):
+        return f"{VectorClockStore.to_list(self.clock)}"
+
+# Reloj vectorial disperso: solo guarda las entradas no nulas, y por cada canal envía
+# únicamente las entradas que cambiaron desde el último mensaje en ese canal (técnica
+# de Singhal-Kshemkalyani; requiere canales FIFO como los de Transport). La fusión y la
+# comparación equivalen a las del reloj denso
+class SparseVectorClock:
+    def __init__(self, num_processes, process_id):
+        self.num_processes = num_processes
+        self.process_id = process_id
+        self.entries = {}  # proceso -> valor, solo entradas no nulas
+        self.version = 0  # Contador local de modificaciones
+        self.last_update = {}  # proceso -> versión en que cambió su entrada
+        self.last_sent = {}  # destino -> versión al enviarle el último mensaje
+
+    @property
+    def clock(self):
+        return self.entries
+
+    def tick(self):
+        # Incrementa el tiempo local del proceso
+        self.version += 1
+        process_id = self.process_id
+        self.entries[process_id] = self.entries.get(process_id, 0) + 1
+        self.last_update[process_id] = self.version
+
+    def update(self, other_clock):
+        # Fusiona un reloj parcial {proceso: valor} (o uno denso) y hace tick local
+        if not isinstance(other_clock, dict):
+            other_clock = dict(zip(*VectorClockStore.sparse(other_clock)))
+        self.version += 1
+        entries, last_update, version = self.entries, self.last_update, self.version
+        for process_id, value in other_clock.items():
+            if value > entries.get(process_id, 0):
+                entries[process_id] = value
+                last_update[process_id] = version
         self.tick()
 
+    def message_for(self, receiver_id):
+        # Carga útil diferencial: entradas modificadas desde el último envío a receiver_id
+        since = self.last_sent.get(receiver_id, 0)
+        self.last_sent[receiver_id] = self.version
+        entries = self.entries
+        return {process_id: entries[process_id]
+                for process_id, version in self.last_update.items() if version > since}
+
+    @staticmethod
+    def compare_sparse(clock_a, clock_b):
+        less = any(value > clock_a.get(i, 0) for i, value in clock_b.items())
+        greater = any(value > clock_b.get(i, 0) for i, value in clock_a.items())
+        if less and greater:
+            return 'concurrent'
+        if less:
+            return 'before'
+        if greater:
+            return 'after'
+        return 'equal'
+
+    def compare(self, other):
+        other_clock = other.clock
+        if not isinstance(other_clock, dict):
+            other_clock = dict(zip(*VectorClockStore.sparse(other_clock)))
+        return self.compare_sparse(self.entries, other_clock)
+
+    def happens_before(self, other):
+        return self.compare(other) == 'before'
+
+    def concurrent_with(self, other):
+        return self.compare(other) == 'concurrent'
+
+    def to_list(self):
+        clock = [0] * self.num_processes
+        for process_id, value in self.entries.items():
+            clock[process_id] = value
+        return clock
+
     def __str__(self):
-        return f"{self.clock}"
+        return f"{dict(sorted(self.entries.items()))}"
 
 # Implementación del algoritmo de Raymond para exclusión mutua
 class RaymondMutex:
-    def __init__(self, process_id):
+    def __init__(self, process_id, tree=None):
         self.process_id = process_id
-        self.holder = process_id
-        self.request_queue = []
+        self.tree = tree
+        self.holder = process_id  # Vecino en dirección al token (o el propio nodo)
+        self.request_queue = deque()  # Cola FIFO de solicitudes (propias o de vecinos)
+        self.using = False
+        self.asked = False
+        # Todos los nodos de un árbol comparten el mismo lock; cada uno espera en su condición
+        self.lock = tree.lock if tree is not None else threading.Lock()
+        self.granted = threading.Condition(self.lock)
 
     def request_access(self):
-        # Solicita acceso a la sección crítica
-        if self.holder != self.process_id:
+        # Solicita acceso a la sección crítica y se bloquea hasta recibir el token
+        with self.lock:
             self.request_queue.append(self.process_id)
-            while self.holder != self.process_id:
-                pass  # Espera activa (no óptimo en un sistema real)
+            self.assign_privilege()
+            self.make_request()
+            if self.tree is not None:
+                self.tree.deliver_pending()
+            while not self.using:
+                self.granted.wait()
 
     def leave_critical_section(self):
-        # Libera la sección crítica
-        if self.request_queue:
-            self.holder = self.request_queue.pop(0)
-        else:
-            self.holder = self.process_id
+        # Libera la sección crítica y reenvía el token si hay solicitudes pendientes
+        with self.lock:
+            self.using = False
+            self.assign_privilege()
+            self.make_request()
+            if self.tree is not None:
+                self.tree.deliver_pending()
+
+    def receive_request(self, sender_id):
+        # Un vecino solicita el token en nombre de su subárbol
+        self.request_queue.append(sender_id)
+        self.assign_privilege()
+        self.make_request()
+
+    def receive_privilege(self):
+        # Llega el token: este nodo pasa a ser el poseedor
+        self.holder = self.process_id
+        self.assign_privilege()
+        self.make_request()
+
+    def assign_privilege(self):
+        # Entrega el token al primero de la cola si este nodo lo posee y no lo usa
+        if self.holder == self.process_id and not self.using and self.request_queue:
+            head = self.request_queue.popleft()
+            self.asked = False
+            if head == self.process_id:
+                self.using = True
+                if self.tree is not None:
+                    self.tree.entries += 1
+                self.granted.notify()
+            else:
+                self.holder = head
+                self.tree.send('PRIVILEGE', self.process_id, head)
+
+    def make_request(self):
+        # Pide el token al vecino que lo tiene, una sola vez por solicitud pendiente
+        if self.holder != self.process_id and self.request_queue and not self.asked:
+            self.asked = True
+            self.tree.send('REQUEST', self.process_id, self.holder)
+
+# Árbol de expansión de nodos Raymond que comparten un único token
+class RaymondTree:
+    def __init__(self, num_processes, fanout=2):
+        self.lock = threading.Lock()
+        self.pending = deque()  # Mensajes en tránsito (tipo, emisor, receptor)
+        self.messages_sent = 0
+        self.entries = 0
+        self.mutexes = [RaymondMutex(i, self) for i in range(num_processes)]
+        # Árbol k-ario con el token inicialmente en la raíz (nodo 0)
+        for mutex in self.mutexes[1:]:
+            mutex.holder = (mutex.process_id - 1) // fanout
+
+    def send(self, message_type, sender_id, receiver_id):
+        self.pending.append((message_type, sender_id, receiver_id))
+        self.messages_sent += 1
+
+    def deliver_pending(self):
+        # Entrega los mensajes en tránsito (se llama con el lock tomado)
+        while self.pending:
+            message_type, sender_id, receiver_id = self.pending.popleft()
+            mutex = self.mutexes[receiver_id]
+            if message_type == 'REQUEST':
+                mutex.receive_request(sender_id)
+            else:
+                mutex.receive_privilege()
+
+    def messages_per_entry(self):
+        return self.messages_sent / self.entries if self.entries else 0.0
 
-# Clase para representar objetos creados por los robots
+# Clase para representar objetos creados por los robots (vista de un registro del heap)
 class RobotObject:
-    def __init__(self, robot_id, task_id):
+    __slots__ = ('robot_id', 'task_id', 'address')
+
+    def __init__(self, robot_id, task_id, address=None):
         self.robot_id = robot_id
         self.task_id = task_id
+        self.address = address
 
     def __str__(self):
         return f"RobotObject(robot={self.robot_id}, task={self.task_id})"
 
 # Implementación del recolector de basura generacional
 class GenerationalCollector:
-    def __init__(self, young_threshold):
-        self.young_generation = []
-        self.old_generation = []
-        self.young_threshold = young_threshold
+    FREE, YOUNG, OLD = -1, 0, 1
+    CARD_SHIFT = 9  # Cada tarjeta cubre 512 direcciones del heap
 
-    def allocate(self, robot_id, task_id):
-        # Crea un nuevo objeto en la generación joven
-        obj = RobotObject(robot_id, task_id)
-        self.young_generation.append(obj)
-        return obj
+    def __init__(self, young_threshold, tenuring_threshold=3, roots=None, metrics=None):
+        self.metrics = metrics  # Registra cada pausa como 'gc_pause_seconds'
+        self.young_threshold = young_threshold  # Capacidad de la generación joven
+        self.tenuring_threshold = tenuring_threshold  # Colecciones sobrevividas antes de promover
+        self.roots = roots  # Función que devuelve las direcciones raíz; None = todo está vivo
+        # Registros de objetos como arreglos paralelos indexados por dirección
+        self.robot_ids = array('i')
+        self.task_ids = array('i')
+        self.refs = array('q')  # Referencia a otro objeto (-1 si no hay)
+        self.ages = array('B')
+        self.generation = array('b')
+        self.marks = bytearray()
+        self.cards = bytearray()  # Tabla de tarjetas: 1 si un objeto viejo de la tarjeta apunta a uno joven
+        self.free = array('q')  # Direcciones libres para reutilizar
+        self.young = array('q')  # Direcciones de la generación joven
+        self.old_count = 0
+        # Con más viejos que esto una recolección menor termina en una completa; tras cada
+        # completa pasa a ser el doble de los viejos que sobrevivieron
+        self.old_limit = young_threshold
+        self.allocated = 0
+        self.promoted = 0
+        self.freed = 0
+        self.collections = 0
+        self.full_collections = 0
+        self.collection_time = 0.0
+
+    def allocate(self, robot_id, task_id, ref=-1):
+        # Crea un nuevo objeto en la generación joven y devuelve su dirección
+        if len(self.young) >= self.young_threshold:
+            self.collect_young()
+        if self.free:
+            addr = self.free.pop()
+            self.robot_ids[addr] = robot_id
+            self.task_ids[addr] = task_id
+            self.refs[addr] = ref
+            self.ages[addr] = 0
+            self.generation[addr] = self.YOUNG
+        else:
+            addr = len(self.robot_ids)
+            self.robot_ids.append(robot_id)
+            self.task_ids.append(task_id)
+            self.refs.append(ref)
+            self.ages.append(0)
+            self.generation.append(self.YOUNG)
+            self.marks.append(0)
+            if addr >> self.CARD_SHIFT >= len(self.cards):
+                self.cards.append(0)
+        self.young.append(addr)
+        self.allocated += 1
+        return addr
+
+    def get(self, addr):
+        return RobotObject(self.robot_ids[addr], self.task_ids[addr], addr)
+
+    def set_ref(self, src, dst):
+        # Escribe una referencia aplicando la barrera de escritura de la tabla de tarjetas
+        self.refs[src] = dst
+        if dst >= 0 and self.generation[src] == self.OLD and self.generation[dst] == self.YOUNG:
+            self.cards[src >> self.CARD_SHIFT] = 1
+
+    def dirty_cards(self):
+        card = self.cards.find(1)
+        while card != -1:
+            yield card
+            card = self.cards.find(1, card + 1)
+
+    def old_to_young(self, card):
+        # Objetos viejos de la tarjeta que apuntan a la generación joven
+        generation, refs = self.generation, self.refs
+        start = card << self.CARD_SHIFT
+        for addr in range(start, min(start + (1 << self.CARD_SHIFT), len(refs))):
+            ref = refs[addr]
+            if generation[addr] == self.OLD and ref >= 0 and generation[ref] == self.YOUNG:
+                yield addr
+
+    def mark(self, stack, young_only):
+        # Marca los objetos alcanzables siguiendo las referencias
+        marks, refs, generation = self.marks, self.refs, self.generation
+        while stack:
+            addr = stack.pop()
+            if marks[addr]:
+                continue
+            marks[addr] = 1
+            ref = refs[addr]
+            if ref >= 0 and not marks[ref] and (not young_only or generation[ref] == self.YOUNG):
+                stack.append(ref)
 
     def collect_young(self):
-        # Realiza la recolección de basura en la generación joven
-        survivors = [obj for obj in self.young_generation if random.random() > 0.3]
-        self.old_generation.extend(survivors[self.young_threshold:])
-        self.young_generation = survivors[:self.young_threshold]
-        return len(self.young_generation), len(self.old_generation)
+        # Recolección menor: solo recorre objetos jóvenes y tarjetas sucias
+        inicio = time.perf_counter()
+        generation, marks = self.generation, self.marks
+        if self.roots is None:
+            stack = list(self.young)
+        else:
+            stack = [addr for addr in self.roots() if generation[addr] == self.YOUNG]
+        dirty = list(self.dirty_cards())
+        for card in dirty:
+            stack.extend(self.refs[addr] for addr in self.old_to_young(card))
+        self.mark(stack, young_only=True)
+
+        survivors = array('q')
+        for addr in self.young:
+            if marks[addr]:
+                marks[addr] = 0
+                age = self.ages[addr] + 1
+                if age >= self.tenuring_threshold:
+                    generation[addr] = self.OLD
+                    self.old_count += 1
+                    self.promoted += 1
+                    ref = self.refs[addr]
+                    if ref >= 0 and generation[ref] == self.YOUNG:
+                        self.cards[addr >> self.CARD_SHIFT] = 1
+                        dirty.append(addr >> self.CARD_SHIFT)
+                else:
+                    self.ages[addr] = age
+                    survivors.append(addr)
+            else:
+                self.release(addr)
+        self.young = survivors
+
+        # Limpia las tarjetas que ya no tienen referencias de viejos a jóvenes
+        for card in dirty:
+            if next(self.old_to_young(card), None) is None:
+                self.cards[card] = 0
+        self.collections += 1
+        pausa = time.perf_counter() - inicio
+        self.collection_time += pausa
+        if self.metrics is not None:
+            self.metrics.observe('gc_pause_seconds', pausa)
+        if self.old_count > self.old_limit:
+            return self.collect_full()
+        return len(self.young), self.old_count
+
+    def collect_full(self):
+        # Recolección completa: marca desde las raíces ambas generaciones
+        if self.roots is None:
+            return len(self.young), self.old_count
+        inicio = time.perf_counter()
+        generation, marks = self.generation, self.marks
+        self.mark(list(self.roots()), young_only=False)
+        for addr in range(len(generation)):
+            if generation[addr] == self.FREE:
+                continue
+            if marks[addr]:
+                marks[addr] = 0
+            else:
+                if generation[addr] == self.OLD:
+                    self.old_count -= 1
+                self.release(addr)
+        self.young = array('q', (addr for addr in self.young if generation[addr] == self.YOUNG))
+        for card in list(self.dirty_cards()):
+            if next(self.old_to_young(card), None) is None:
+                self.cards[card] = 0
+        self.old_limit = max(self.young_threshold, 2 * self.old_count)
+        self.collections += 1
+        self.full_collections += 1
+        pausa = time.perf_counter() - inicio
+        self.collection_time += pausa
+        if self.metrics is not None:
+            self.metrics.observe('gc_pause_seconds', pausa)
+        return len(self.young), self.old_count
+
+    def release(self, addr):
+        self.generation[addr] = self.FREE
+        self.refs[addr] = -1
+        self.free.append(addr)
+        self.freed += 1
+
+# Transporte de mensajes con canales FIFO por par (emisor, receptor)
+class Transport:
+    def __init__(self, processes):
+        self.processes = processes
+        self.channels = {}  # (emisor, receptor) -> deque; solo existen los canales no vacíos
+        self.ready = deque()  # Canales con mensajes pendientes, atendidos en turno rotativo
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def send(self, sender_id, receiver_id, message):
+        key = (sender_id, receiver_id)
+        queue = self.channels.get(key)
+        if queue is None:
+            queue = self.channels[key] = deque()
+            self.ready.append(key)
+        queue.append(message)
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.max_in_flight = self.in_flight
+
+    def run(self):
+        # Bucle planificador: entrega mensajes hasta vaciar todos los canales
+        while self.ready:
+            key = self.ready.popleft()
+            queue = self.channels[key]
+            message = queue.popleft()
+            if queue:
+                self.ready.append(key)
+            else:
+                del self.channels[key]
+            self.in_flight -= 1
+            self.processes[key[1]].receive_message(message)
+
+# Registro binario en disco de instantáneas completadas, con reproducción diferida
+class SnapshotLog:
+    HEADER = struct.Struct('<cII')  # tipo de registro, id de instantánea, id de proceso
+    STATE = b'S'  # Estado local y reloj (entradas no nulas)
+    CHANNEL = b'C'  # Mensajes de un canal, como deltas respecto al reloj de la instantánea
+    DONE = b'F'  # La instantánea terminó: todos sus registros ya están escritos
+
+    def __init__(self, path=None):
+        # Sin ruta se usa un archivo temporal anónimo que se borra al cerrarse
+        if path is None:
+            self.file = tempfile.TemporaryFile(buffering=1 << 16)
+        else:
+            self.file = open(path, 'w+b', buffering=1 << 16)
+
+    @staticmethod
+    def pack_sparse(indices, values):
+        n = len(indices)
+        return struct.pack(f'<I{n}I{n}q', n, *indices, *values)
+
+    @staticmethod
+    def unpack_sparse(buffer, offset):
+        (n,) = struct.unpack_from('<I', buffer, offset)
+        offset += 4
+        fields = struct.unpack_from(f'<{n}I{n}q', buffer, offset)
+        return dict(zip(fields[:n], fields[n:])), offset + 12 * n
+
+    def write_state(self, snapshot_id, process_id, state, clock):
+        encoded = state.encode('utf-8')
+        self.file.write(self.HEADER.pack(self.STATE, snapshot_id, process_id)
+                        + struct.pack('<I', len(encoded)) + encoded
+                        + self.pack_sparse(*VectorClockStore.sparse(clock)))
+
+    def write_channel(self, snapshot_id, process_id, sender_id, deltas):
+        parts = [self.HEADER.pack(self.CHANNEL, snapshot_id, process_id),
+                 struct.pack('<II', sender_id, len(deltas))]
+        parts.extend(self.pack_sparse(*delta) for delta in deltas)
+        self.file.write(b''.join(parts))
+
+    def write_done(self, snapshot_id, initiator_id):
+        self.file.write(self.HEADER.pack(self.DONE, snapshot_id, initiator_id))
+
+    def replay(self):
+        # Recorre el registro mapeado en memoria y produce cada instantánea completa
+        # como (id, {proceso: {'state', 'clock', 'channels'}}); los relojes son dicts
+        # dispersos. Con relojes densos cada mensaje de canal solo guarda las entradas
+        # que difieren del reloj de la instantánea (ver apply_delta); con relojes
+        # dispersos guarda las entradas que llevaba el mensaje.
+        self.file.flush()
+        size = self.file.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        with mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+            partial = defaultdict(dict)
+            offset = 0
+            while offset < size:
+                kind, snapshot_id, process_id = self.HEADER.unpack_from(buffer, offset)
+                offset += self.HEADER.size
+                if kind == self.STATE:
+                    (length,) = struct.unpack_from('<I', buffer, offset)
+                    offset += 4
+                    state = bytes(buffer[offset:offset + length]).decode('utf-8')
+                    clock, offset = self.unpack_sparse(buffer, offset + length)
+                    partial[snapshot_id][process_id] = {'state': state, 'clock': clock, 'channels': {}}
+                elif kind == self.CHANNEL:
+                    sender_id, count = struct.unpack_from('<II', buffer, offset)
+                    offset += 8
+                    deltas = []
+                    for _ in range(count):
+                        delta, offset = self.unpack_sparse(buffer, offset)
+                        deltas.append(delta)
+                    partial[snapshot_id][process_id]['channels'][sender_id] = deltas
+                else:
+                    yield snapshot_id, partial.pop(snapshot_id, {})
+
+    @staticmethod
+    def apply_delta(clock, delta, num_processes):
+        # Reconstruye un reloj denso a partir del reloj base disperso y un delta
+        dense = [0] * num_processes
+        for i, value in clock.items():
+            dense[i] = value
+        for i, value in delta.items():
+            dense[i] = value
+        return dense
+
+    def close(self):
+        self.file.close()
+
+# Coordinador de instantáneas concurrentes identificadas por id
+class SnapshotManager:
+    def __init__(self, num_channels, log=None):
+        self.num_channels = num_channels  # Canales dirigidos: un marcador por canal y por instantánea
+        self.log = log if log is not None else SnapshotLog()
+        self.outstanding = {}  # id -> marcadores aún no recibidos
+        self.next_id = 0
+        self.completed = 0
+        self.last_completed = None
+
+    def start(self, initiator):
+        # Inicia una nueva instantánea sin esperar a que terminen las anteriores
+        snapshot_id = self.next_id
+        self.next_id += 1
+        self.outstanding[snapshot_id] = self.num_channels
+        initiator.record_snapshot(snapshot_id)
+        if self.num_channels == 0:
+            self.finish(snapshot_id, initiator.process_id)
+        return snapshot_id
+
+    def marker_received(self, snapshot_id, initiator_id):
+        self.outstanding[snapshot_id] -= 1
+        if self.outstanding[snapshot_id] == 0:
+            self.finish(snapshot_id, initiator_id)
+
+    def finish(self, snapshot_id, initiator_id):
+        del self.outstanding[snapshot_id]
+        self.log.write_done(snapshot_id, initiator_id)
+        self.completed += 1
+        self.last_completed = snapshot_id
+
+    def in_flight(self):
+        return len(self.outstanding)
+
+# Estado de una instantánea local mientras quedan canales de entrada abiertos
+class LocalSnapshot:
+    __slots__ = ('snapshot_id', 'state', 'clock', 'pending', 'channels')
+
+    def __init__(self, snapshot_id, state, clock, pending):
+        self.snapshot_id = snapshot_id
+        self.state = state
+        self.clock = clock  # Copia del reloj local al registrar la instantánea
+        self.pending = pending  # Vecinos cuyo marcador aún no llegó
+        self.channels = defaultdict(list)  # emisor -> deltas de reloj de los mensajes en tránsito
+
+    def delta(self, clock):
+        # Entradas del reloj recibido que difieren del reloj de la instantánea
+        if isinstance(clock, dict):
+            # Mensaje de un reloj disperso: ya es un delta (respecto al mensaje anterior del
+            # canal, no a este reloj) y se guarda tal cual se envió
+            return VectorClockStore.sparse(clock)
+        if np is not None and hasattr(clock, 'tolist'):
+            indices = np.flatnonzero(clock != self.clock).tolist()
+            return indices, clock[indices].tolist()
+        indices = [i for i, (a, b) in enumerate(zip(clock, self.clock)) if a != b]
+        return indices, [int(clock[i]) for i in indices]
 
 # Implementación del algoritmo de Chandy-Lamport para instantáneas globales
 class Process:
     def __init__(self, process_id):
         self.process_id = process_id
         self.state = f"Initial State {process_id}"
-        self.channels = defaultdict(list)
         self.neighbors = []
-        self.marker_received = {}
-        self.local_snapshot = None
+        self.snapshots = {}  # Instantáneas locales abiertas, por id
+        self.local_snapshot = None  # Estado registrado en la instantánea más reciente
         self.vector_clock = None
+        self.transport = None
+        self.snapshot_manager = None
+        self.trace = None  # EventTrace de SistemaCoordinacion: los mensajes se registran al entregarse
+        self.live_tasks = deque()  # Direcciones de los objetos de las tareas vivas (raíces del GC)
 
     def set_neighbors(self, neighbors):
         self.neighbors = neighbors
-        for neighbor in neighbors:
-            self.marker_received[neighbor.process_id] = False
 
     def initiate_snapshot(self):
         # Inicia el proceso de toma de instantánea
+        return self.snapshot_manager.start(self)
+
+    def record_snapshot(self, snapshot_id, initiator_id=None):
+        # Registra el estado local y envía marcadores por todos los canales de salida
+        initiator_id = self.process_id if initiator_id is None else initiator_id
+        clock = self.vector_clock.clock
+        local = LocalSnapshot(snapshot_id, self.state,
+                              clock.copy() if hasattr(clock, 'copy') else list(clock),
+                              {neighbor.process_id for neighbor in self.neighbors})
+        self.snapshots[snapshot_id] = local
         self.local_snapshot = self.state
-        self.marker_received = {neighbor: False for neighbor in self.marker_received}
+        self.snapshot_manager.log.write_state(snapshot_id, self.process_id, self.state, local.clock)
+        marker = ('MARKER', self.process_id, (snapshot_id, initiator_id))
         for neighbor in self.neighbors:
-            neighbor.receive_message(('MARKER', self.process_id, self.vector_clock.clock))
+            self.transport.send(self.process_id, neighbor.process_id, marker)
+        if not local.pending:
+            del self.snapshots[snapshot_id]
+        return local
+
+    def close_channel(self, local, sender_id, initiator_id):
+        # El marcador cierra el canal: se vuelcan sus mensajes al registro
+        local.pending.discard(sender_id)
+        deltas = local.channels.pop(sender_id, None)
+        if deltas:
+            self.snapshot_manager.log.write_channel(local.snapshot_id, self.process_id, sender_id, deltas)
+        if not local.pending:
+            del self.snapshots[local.snapshot_id]
+        self.snapshot_manager.marker_received(local.snapshot_id, initiator_id)
 
     def receive_message(self, message):
         # Procesa mensajes recibidos, incluyendo marcadores para instantáneas
         message_type, sender_id, content = message
         if message_type == 'MARKER':
-            if self.local_snapshot is None:
-                self.local_snapshot = self.state
-                self.marker_received[sender_id] = True
-                for neighbor in self.neighbors:
-                    if neighbor.process_id != sender_id:
-                        neighbor.receive_message(('MARKER', self.process_id, self.vector_clock.clock))
-            else:
-                self.marker_received[sender_id] = True
+            snapshot_id, initiator_id = content
+            local = self.snapshots.get(snapshot_id)
+            if local is None:
+                local = self.record_snapshot(snapshot_id, initiator_id)
+            self.close_channel(local, sender_id, initiator_id)
         else:
-            if self.local_snapshot is not None and not all(self.marker_received.values()):
-                self.channels[sender_id].append(content)
+            for local in self.snapshots.values():
+                if sender_id in local.pending:
+                    local.channels[sender_id].append(local.delta(content))
+            if self.trace is not None:
+                self.trace.message(sender_id, self.process_id, content)
             self.vector_clock.update(content)
             self.state = f"State after message from {sender_id}"
 
@@ -115,80 +774,446 @@ class Process:
         self.state = new_state
         self.vector_clock.tick()
 
+# Traza binaria de una ejecución de SistemaCoordinacion: tareas, mensajes con su reloj,
+# instantáneas y recolecciones, escritos en lotes. Cada `checkpoint_every` tareas se
+# guarda el estado completo de los robots para poder saltar a cualquier tarea. Los
+# marcadores no se guardan: son consecuencia determinista del inicio de la instantánea
+class EventTrace:
+    MAGIC = b'TRC1'
+    HEADER = struct.Struct('<4sI')  # marca, número de robots
+    TASK = struct.Struct('<cII')  # 'T', robot, número de estado
+    MESSAGE = struct.Struct('<cII')  # 'M', emisor, receptor; sigue el reloj enviado (disperso)
+    SNAPSHOT = struct.Struct('<cII')  # 'S', id de instantánea, tareas completadas
+    GC = struct.Struct('<cIII')  # 'G', colecciones, objetos jóvenes, objetos viejos
+    CHECKPOINT = struct.Struct('<cIII')  # 'K', tareas completadas, robots, bytes que siguen
+    FOOTER = struct.Struct('<cII')  # 'X', puntos de control, instantáneas; siguen los índices
+    TRAILER = struct.Struct('<Q4s')  # posición del pie, marca
+    BATCH = 1 << 16  # Bytes acumulados antes de escribir al archivo
+
+    def __init__(self, path, num_robots, checkpoint_every=1000):
+        self.file = open(path, 'wb')
+        self.checkpoint_every = checkpoint_every
+        self.buffer = bytearray(self.HEADER.pack(self.MAGIC, num_robots))
+        self.written = 0  # Bytes ya escritos al archivo
+        self.tasks = 0
+        self.checkpoints = []  # (tareas completadas, posición)
+        self.snapshots = []  # (id de instantánea, tareas completadas)
+
+    def append(self, record):
+        self.buffer += record
+        if len(self.buffer) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.written += len(self.buffer)
+        self.buffer.clear()
+
+    def task(self, robots, robot_id, state_number):
+        # Antes de cada tarea múltiplo de checkpoint_every se guarda un punto de control
+        if self.tasks % self.checkpoint_every == 0:
+            self.checkpoint(robots)
+        self.append(self.TASK.pack(b'T', robot_id, state_number))
+        self.tasks += 1
+
+    def message(self, sender_id, receiver_id, clock):
+        self.append(self.MESSAGE.pack(b'M', sender_id, receiver_id)
+                    + SnapshotLog.pack_sparse(*VectorClockStore.sparse(clock)))
+
+    def snapshot(self, snapshot_id):
+        self.snapshots.append((snapshot_id, self.tasks))
+        self.append(self.SNAPSHOT.pack(b'S', snapshot_id, self.tasks))
+
+    def collection(self, collections, young, old):
+        self.append(self.GC.pack(b'G', collections, young, old))
+
+    def checkpoint(self, robots):
+        parts = []
+        for robot in robots:
+            encoded = robot.state.encode('utf-8')
+            parts.append(struct.pack('<I', len(encoded)) + encoded)
+            parts.append(SnapshotLog.pack_sparse(*VectorClockStore.sparse(robot.vector_clock.clock)))
+        body = b''.join(parts)
+        self.checkpoints.append((self.tasks, self.written + len(self.buffer)))
+        self.append(self.CHECKPOINT.pack(b'K', self.tasks, len(robots), len(body)) + body)
+
+    def close(self):
+        # Pie con los índices de puntos de control e instantáneas para saltar sin recorrer
+        footer = self.written + len(self.buffer)
+        parts = [self.FOOTER.pack(b'X', len(self.checkpoints), len(self.snapshots))]
+        parts.extend(struct.pack('<IQ', tasks, offset) for tasks, offset in self.checkpoints)
+        parts.extend(struct.pack('<II', snapshot_id, tasks) for snapshot_id, tasks in self.snapshots)
+        parts.append(self.TRAILER.pack(footer, self.MAGIC))
+        self.append(b''.join(parts))
+        self.flush()
+        self.file.close()
+
+# Estado de los robots reconstruido a partir de una traza
+class ReplayState:
+    __slots__ = ('tasks', 'states', 'clocks', 'snapshots', 'collections', 'generations')
+
+    def __init__(self, num_robots):
+        self.tasks = 0  # Tareas completadas
+        self.states = [f"Initial State {i}" for i in range(num_robots)]
+        self.clocks = [{} for _ in range(num_robots)]  # Relojes dispersos
+        self.snapshots = []  # Instantáneas iniciadas desde el punto de partida
+        self.collections = 0
+        self.generations = (0, 0)  # (jóvenes, viejos) tras la última recolección registrada
+
+# Reproducción de una traza: solo aplica estados y relojes, sin mutex, GC ni transporte
+class TraceReplay:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_robots = EventTrace.HEADER.unpack_from(self.map, 0)
+        if magic != EventTrace.MAGIC:
+            raise ValueError(f"{path} no es una traza de SistemaCoordinacion")
+        self.checkpoints = []
+        self.snapshots = {}
+        footer, magic = EventTrace.TRAILER.unpack_from(self.map, len(self.map) - EventTrace.TRAILER.size)
+        if magic != EventTrace.MAGIC:
+            raise ValueError(f"{path} no tiene pie: la traza no se cerró")
+        self.end = footer
+        _, num_checkpoints, num_snapshots = EventTrace.FOOTER.unpack_from(self.map, footer)
+        offset = footer + EventTrace.FOOTER.size
+        for _ in range(num_checkpoints):
+            self.checkpoints.append(struct.unpack_from('<IQ', self.map, offset))
+            offset += 12
+        for _ in range(num_snapshots):
+            snapshot_id, tasks = struct.unpack_from('<II', self.map, offset)
+            self.snapshots[snapshot_id] = tasks
+            offset += 8
+
+    def load_checkpoint(self, offset):
+        _, tasks, num_robots, _ = EventTrace.CHECKPOINT.unpack_from(self.map, offset)
+        offset += EventTrace.CHECKPOINT.size
+        state = ReplayState(0)
+        state.tasks = tasks
+        for _ in range(num_robots):
+            (length,) = struct.unpack_from('<I', self.map, offset)
+            offset += 4
+            state.states.append(self.map[offset:offset + length].decode('utf-8'))
+            clock, offset = SnapshotLog.unpack_sparse(self.map, offset + length)
+            state.clocks.append(clock)
+        return state, offset
+
+    def seek(self, task_index):
+        # Estado tras completar task_index tareas: parte del punto de control anterior
+        position = bisect.bisect_right([tasks for tasks, _ in self.checkpoints], task_index) - 1
+        if position < 0:
+            return self.replay(ReplayState(self.num_robots), EventTrace.HEADER.size, task_index)
+        state, offset = self.load_checkpoint(self.checkpoints[position][1])
+        return self.replay(state, offset, task_index)
+
+    def snapshot(self, snapshot_id):
+        # Estados y relojes de los robots en el momento de la instantánea
+        return self.seek(self.snapshots[snapshot_id])
+
+    def replay(self, state, offset=None, stop_tasks=None):
+        # Aplica los registros desde offset hasta el fin o hasta completar stop_tasks tareas
+        mm, end = self.map, self.end
+        offset = EventTrace.HEADER.size if offset is None else offset
+        task, message, snapshot_record, gc, checkpoint = (EventTrace.TASK, EventTrace.MESSAGE,
+                                                          EventTrace.SNAPSHOT, EventTrace.GC,
+                                                          EventTrace.CHECKPOINT)
+        states, clocks = state.states, state.clocks
+        while offset < end:
+            kind = mm[offset:offset + 1]
+            if kind == b'T':
+                if state.tasks == stop_tasks:
+                    break
+                _, robot_id, number = task.unpack_from(mm, offset)
+                offset += task.size
+                states[robot_id] = f"Estado después de tarea {number}"
+                clock = clocks[robot_id]
+                clock[robot_id] = clock.get(robot_id, 0) + 1
+                state.tasks += 1
+            elif kind == b'M':
+                _, sender_id, receiver_id = message.unpack_from(mm, offset)
+                received, offset = SnapshotLog.unpack_sparse(mm, offset + message.size)
+                clock = clocks[receiver_id]
+                for process_id, value in received.items():
+                    if value > clock.get(process_id, 0):
+                        clock[process_id] = value
+                clock[receiver_id] = clock.get(receiver_id, 0) + 1
+                states[receiver_id] = f"State after message from {sender_id}"
+            elif kind == b'S':
+                _, snapshot_id, _ = snapshot_record.unpack_from(mm, offset)
+                offset += snapshot_record.size
+                state.snapshots.append(snapshot_id)
+            elif kind == b'G':
+                _, state.collections, young, old = gc.unpack_from(mm, offset)
+                offset += gc.size
+                state.generations = (young, old)
+            elif kind == b'K':
+                offset += checkpoint.size + checkpoint.unpack_from(mm, offset)[3]
+            else:
+                raise ValueError(f"Registro desconocido {kind!r} en la posición {offset}")
+        return state
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
 # Sistema principal de coordinación de tareas
 class SistemaCoordinacion:
-    def __init__(self, num_robots, num_tareas):
+    def __init__(self, num_robots, num_tareas, vecinos_por_robot=None, tareas_vivas=4,
+                 verbose=True, metrics=None, relojes_dispersos=False, seed=None, traza=None,
+                 checkpoint_every=1000, trabajo=0.0):
+        self.verbose = verbose  # Con False no se imprime nada por cada paso
+        self.rng = random.Random(seed)  # Generador propio: la ejecución es reproducible
+        # Con traza=ruta se registra la ejecución para reproducirla con TraceReplay
+        self.traza = None if traza is None else EventTrace(traza, num_robots, checkpoint_every)
+        self.metrics = metrics if metrics is not None else Metrics()
         self.num_robots = num_robots
         self.num_tareas = num_tareas
+        self.tareas_vivas = tareas_vivas  # Tareas recientes por robot cuyos objetos siguen vivos
+        self.trabajo = trabajo  # Segundos que cada tarea trabaja fuera de la sección crítica
+        # Protege relojes, canales, instantáneas y traza cuando las tareas corren en varios hilos
+        self.lock = threading.Lock()
+        self.entrega_diferida = False  # Con True los mensajes los entrega otro hilo, no el emisor
         self.robots = [Process(i) for i in range(num_robots)]
-        self.mutexes = [RaymondMutex(i) for i in range(num_robots)]
+        self.transporte = Transport(self.robots)
+        self.arbol_mutex = RaymondTree(num_robots)  # Un único token compartido por todos los robots
+        self.mutexes = self.arbol_mutex.mutexes
+        # Relojes de todos los robots en una sola matriz, o dispersos y diferenciales por robot
+        # (memoria y mensajes proporcionales a los robots con los que hubo comunicación)
+        self.relojes = None if relojes_dispersos else VectorClockStore(num_robots)
         for i, robot in enumerate(self.robots):
-            robot.vector_clock = VectorClock(num_robots, i)
-            neighbors = self.robots[:i] + self.robots[i+1:]
-            robot.set_neighbors(neighbors)
-        self.collector = GenerationalCollector(100)
+            if relojes_dispersos:
+                robot.vector_clock = SparseVectorClock(num_robots, i)
+            else:
+                robot.vector_clock = VectorClock(num_robots, i, self.relojes)
+            robot.transport = self.transporte
+            robot.trace = self.traza
+            robot.set_neighbors(self.vecinos(i, vecinos_por_robot))
+        self.instantaneas = SnapshotManager(sum(len(robot.neighbors) for robot in self.robots))
+        for robot in self.robots:
+            robot.snapshot_manager = self.instantaneas
+        # La generación joven alcanza para las tareas vivas de toda la flota: la mayoría de
+        # los objetos muere antes de ser promovido
+        self.collector = GenerationalCollector(max(100, 2 * tareas_vivas * num_robots), roots=self.raices,
+                                               metrics=self.metrics)
+
+    def raices(self):
+        # Conjunto raíz del recolector: objetos de las tareas vivas de cada robot
+        for robot in self.robots:
+            yield from robot.live_tasks
+
+    def vecinos(self, robot_id, vecinos_por_robot):
+        # Malla completa por defecto; con vecinos_por_robot se usa un anillo simétrico
+        # de grado acotado, para que las instantáneas escalen con O(N * grado) marcadores
+        if vecinos_por_robot is None or vecinos_por_robot >= self.num_robots - 1:
+            return self.robots[:robot_id] + self.robots[robot_id+1:]
+        ids = set()
+        for salto in range(1, vecinos_por_robot // 2 + 1):
+            ids.add((robot_id + salto) % self.num_robots)
+            ids.add((robot_id - salto) % self.num_robots)
+        ids.discard(robot_id)
+        return [self.robots[i] for i in sorted(ids)]
 
-    def ejecutar_tareas(self):
+    def ejecutar_tareas(self, instantanea_cada=2):
         for task in range(self.num_tareas):
-            print(f"\n--- Tarea {task + 1} ---")
-            robot_id = random.randint(0, self.num_robots - 1)
+            if self.verbose:
+                print(f"\n--- Tarea {task + 1} ---")
+            robot_id = self.rng.randint(0, self.num_robots - 1)
             self.ejecutar_tarea(robot_id)
-            if task % 2 == 1:  # Tomar instantánea cada 2 tareas
+            if task % instantanea_cada == instantanea_cada - 1:  # Por defecto, cada 2 tareas
                 self.tomar_instantanea()
 
+    def ejecutar_tareas_concurrentes(self, num_trabajadores=8, instantanea_cada=2, intervalo_entrega=0.0005):
+        # Versión concurrente de ejecutar_tareas: este hilo despacha las tareas a
+        # num_trabajadores hilos e inicia instantáneas mientras hay tareas en curso. Cada
+        # robot ejecuta sus tareas de a una; robots distintos trabajan a la vez y solo se
+        # serializan en la sección crítica (token de Raymond) y al tocar relojes y canales
+        # (self.lock). Los mensajes los entrega un hilo aparte, de modo que las instantáneas
+        # encuentran mensajes en tránsito. El entrelazado no es reproducible aunque haya
+        # semilla; la traza, si la hay, registra el que ocurrió. Si una tarea falla, los
+        # demás hilos siguen y el primer error se relanza al terminar
+        pendientes = queue.Queue(maxsize=num_trabajadores * 4)
+        ocupados = [threading.Lock() for _ in range(self.num_robots)]  # Una tarea a la vez por robot
+        terminado = threading.Event()
+        errores = []
+
+        def trabajador():
+            while True:
+                robot_id = pendientes.get()
+                if robot_id is None:
+                    return
+                try:
+                    with ocupados[robot_id]:
+                        self.ejecutar_tarea(robot_id)
+                except Exception as error:
+                    errores.append(error)
+                finally:
+                    pendientes.task_done()
+
+        def entregar():
+            while not terminado.wait(intervalo_entrega):
+                try:
+                    with self.lock:
+                        self.transporte.run()
+                except Exception as error:
+                    errores.append(error)
+                    return
+
+        self.entrega_diferida = True
+        hilos = [threading.Thread(target=trabajador) for _ in range(num_trabajadores)]
+        hilos.append(threading.Thread(target=entregar))
+        for hilo in hilos:
+            hilo.start()
+        try:
+            for task in range(self.num_tareas):
+                pendientes.put(self.rng.randint(0, self.num_robots - 1))
+                if task % instantanea_cada == instantanea_cada - 1:
+                    with self.lock:
+                        snapshot_id = self.iniciar_instantanea()
+                        if self.traza is not None:
+                            self.traza.snapshot(snapshot_id)
+                    self.metrics.inc('snapshots')
+            pendientes.join()
+        finally:
+            for _ in range(num_trabajadores):
+                pendientes.put(None)
+            terminado.set()
+            for hilo in hilos:
+                hilo.join()
+            self.entrega_diferida = False
+            try:
+                with self.lock:
+                    self.transporte.run()  # Completa las instantáneas que quedaban en curso
+            except Exception as error:
+                errores.append(error)
+        if errores:
+            raise errores[0]
+
     def ejecutar_tarea(self, robot_id):
         # Ejecuta una tarea en un robot específico
         robot = self.robots[robot_id]
         mutex = self.mutexes[robot_id]
+        metrics = self.metrics
         
-        print(f"Robot {robot_id} iniciando tarea")
-        print(f"Reloj Robot {robot_id}: {robot.vector_clock}")
+        if self.verbose:
+            print(f"Robot {robot_id} iniciando tarea")
+            print(f"Reloj Robot {robot_id}: {robot.vector_clock}")
 
+        inicio = time.perf_counter()
+        if self.trabajo:
+            time.sleep(self.trabajo)  # Trabajo propio del robot, en paralelo con los demás
+        espera = time.perf_counter()
         mutex.request_access()  # Solicita acceso exclusivo (Raymond)
-        
-        nuevo_estado = f"Estado después de tarea {random.randint(1, 10)}"
-        robot.update_state(nuevo_estado)
-        print(f"Robot {robot_id} nuevo estado: {nuevo_estado}")
-
-        obj = self.collector.allocate(robot_id, random.randint(1, 1000))
-        print(f"Objeto alocado para robot {robot_id}: {obj}")
+        metrics.observe('mutex_wait_seconds', time.perf_counter() - espera)
+        try:
+            numero = self.rng.randint(1, 10)
+            nuevo_estado = f"Estado después de tarea {numero}"
+            with self.lock:  # Una entrega de otro hilo puede estar fusionando este reloj
+                if self.traza is not None:
+                    self.traza.task(self.robots, robot_id, numero)
+                robot.update_state(nuevo_estado)
+            if self.verbose:
+                print(f"Robot {robot_id} nuevo estado: {nuevo_estado}")
 
-        mutex.leave_critical_section()  # Libera acceso exclusivo
+            # El objeto nuevo referencia al de la tarea anterior del robot
+            previo = robot.live_tasks[-1] if robot.live_tasks else -1
+            colecciones = self.collector.collections
+            addr = self.collector.allocate(robot_id, self.rng.randint(1, 1000), previo)
+            if self.traza is not None and self.collector.collections != colecciones:
+                with self.lock:
+                    self.traza.collection(self.collector.collections, len(self.collector.young),
+                                          self.collector.old_count)
+            robot.live_tasks.append(addr)
+            if len(robot.live_tasks) > self.tareas_vivas:
+                robot.live_tasks.popleft()
+                # La tarea más antigua que sigue viva deja de retener a su predecesora
+                self.collector.set_ref(robot.live_tasks[0], -1)
+            if self.verbose:
+                print(f"Objeto alocado para robot {robot_id}: {self.collector.get(addr)}")
+        finally:
+            mutex.leave_critical_section()  # Libera acceso exclusivo aunque la tarea falle
 
         self.enviar_mensaje(robot_id)
+        metrics.inc('tasks')
+        metrics.observe('task_seconds', time.perf_counter() - inicio)
 
     def enviar_mensaje(self, robot_id):
         # Envía un mensaje a un robot vecino aleatorio
         if self.robots[robot_id].neighbors:
-            destino = random.choice(self.robots[robot_id].neighbors)
-            mensaje = self.robots[robot_id].vector_clock.clock
-            destino.receive_message(('NORMAL', robot_id, mensaje))
-            print(f"Robot {robot_id} envió mensaje a Robot {destino.process_id}")
+            destino = self.rng.choice(self.robots[robot_id].neighbors)
+            with self.lock:
+                mensaje = self.robots[robot_id].vector_clock.message_for(destino.process_id)
+                if self.entrega_diferida:
+                    # El reloj denso es una vista y el emisor lo cambiará antes de la entrega
+                    mensaje = mensaje.copy()
+                self.transporte.send(robot_id, destino.process_id, ('NORMAL', robot_id, mensaje))
+                if not self.entrega_diferida:
+                    self.transporte.run()  # Se entrega antes de que el emisor vuelva a cambiar su reloj
+            self.metrics.inc('messages_sent')
+            self.metrics.inc('clock_entries_sent', len(mensaje))
+            if self.verbose:
+                print(f"Robot {robot_id} envió mensaje a Robot {destino.process_id}")
+
+    def iniciar_instantanea(self, robot_id=0):
+        # Inicia una instantánea sin esperar a que terminen las que ya están en curso
+        return self.robots[robot_id].initiate_snapshot()
 
     def tomar_instantanea(self):
         # Inicia el proceso de toma de instantánea global (Chandy-Lamport)
-        print("\n--- Iniciando instantánea global ---")
-        self.robots[0].initiate_snapshot()
-        while not all(robot.local_snapshot is not None for robot in self.robots):
-            pass
-        print("Instantánea global completada")
+        if self.verbose:
+            print("\n--- Iniciando instantánea global ---")
+        inicio = time.perf_counter()
+        with self.lock:
+            snapshot_id = self.iniciar_instantanea()
+            if self.traza is not None:
+                self.traza.snapshot(snapshot_id)
+            self.transporte.run()
+        self.metrics.observe('snapshot_seconds', time.perf_counter() - inicio)
+        self.metrics.inc('snapshots')
+        if not self.verbose:
+            return
+        if snapshot_id not in self.instantaneas.outstanding:
+            print("Instantánea global completada")
+        else:
+            print(f"Instantánea incompleta: faltan {self.instantaneas.outstanding[snapshot_id]} marcadores")
 
     def recolectar_basura(self):
-        # Realiza la recolección de basura generacional
-        print("\n--- Recolección de basura ---")
-        young, old = self.collector.collect_young()
-        print(f"Objetos en generación joven: {young}")
-        print(f"Objetos en generación vieja: {old}")
+        # Recolección completa de ambas generaciones
+        young, old = self.collector.collect_full()
+        if self.traza is not None:
+            self.traza.collection(self.collector.collections, young, old)
+        if self.verbose:
+            print("\n--- Recolección de basura ---")
+            print(f"Objetos en generación joven: {young}")
+            print(f"Objetos en generación vieja: {old}")
+
+    def cerrar(self):
+        # Cierra la traza (escribe su pie con los índices) y el registro de instantáneas
+        if self.traza is not None:
+            self.traza.close()
+        self.instantaneas.log.close()
 
     def mostrar_instantaneas(self):
-        # Muestra las instantáneas tomadas de todos los robots
+        # Muestra la última instantánea completada, leída del registro en disco
         print("\n--- Mostrando instantáneas ---")
+        ultima = None
+        for snapshot_id, estados in self.instantaneas.log.replay():
+            if snapshot_id == self.instantaneas.last_completed:
+                ultima = estados
+        if ultima is None:
+            print("No hay instantáneas completadas")
+            return
         for robot in self.robots:
+            estado = ultima.get(robot.process_id)
             print(f"Robot {robot.process_id}:")
-            print(f"  Estado local: {robot.local_snapshot}")
+            print(f"  Estado local: {estado['state'] if estado else None}")
             print(f"  Reloj vectorial: {robot.vector_clock}")
-            for neighbor_id, channel in robot.channels.items():
-                print(f"  Canal desde Robot {neighbor_id}: {channel}")
+            if estado:
+                for neighbor_id, deltas in estado['channels'].items():
+                    if self.relojes is None:
+                        channel = deltas  # Entradas enviadas por el reloj disperso
+                    else:
+                        channel = [SnapshotLog.apply_delta(estado['clock'], delta, self.num_robots)
+                                   for delta in deltas]
+                    print(f"  Canal desde Robot {neighbor_id}: {channel}")
             print()
 
 def main():
@@ -200,5 +1225,224 @@ def main():
     sistema.recolectar_basura()
     sistema.mostrar_instantaneas()
 
+def benchmark_raymond(num_robots=1000, num_entradas=10000, num_hilos=1, seed=0):
+    # Mide rendimiento y latencia del token de Raymond con solicitantes aleatorios
+    arbol = RaymondTree(num_robots)
+    latencias = []
+
+    def trabajador(hilo):
+        rng = random.Random(seed + hilo)
+        propios = range(hilo, num_robots, num_hilos)  # Robots disjuntos por hilo
+        for _ in range(num_entradas // num_hilos):
+            mutex = arbol.mutexes[rng.choice(propios)]
+            inicio = time.perf_counter()
+            mutex.request_access()
+            latencias.append(time.perf_counter() - inicio)
+            mutex.leave_critical_section()
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(h,)) for h in range(num_hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    print(f"Robots: {num_robots}, hilos: {num_hilos}, entradas: {arbol.entries}")
+    print(f"Entradas por segundo: {arbol.entries / duracion:.0f}")
+    print(f"Latencia p50: {latencias[len(latencias) // 2] * 1e6:.1f} us, "
+          f"p99: {latencias[int(len(latencias) * 0.99)] * 1e6:.1f} us")
+    print(f"Mensajes por entrada a la sección crítica: {arbol.messages_per_entry():.2f}")
+
+# Versión original basada en listas, usada como referencia en benchmark_gc
+class ListGenerationalCollector:
+    def __init__(self, young_threshold):
+        self.young_generation = []
+        self.old_generation = []
+        self.young_threshold = young_threshold
+
+    def allocate(self, robot_id, task_id):
+        obj = RobotObject(robot_id, task_id)
+        self.young_generation.append(obj)
+        return obj
+
+    def collect_young(self):
+        survivors = [obj for obj in self.young_generation if random.random() > 0.3]
+        self.old_generation.extend(survivors[self.young_threshold:])
+        self.young_generation = survivors[:self.young_threshold]
+        return len(self.young_generation), len(self.old_generation)
+
+def benchmark_gc(num_objetos=1000000, generacion_joven=10000, ventana=1000, seed=0):
+    # Compara el heap con arreglos frente a la versión con listas asignando num_objetos;
+    # una ventana de objetos recientes y un 1% de objetos permanentes actúan como raíces
+    rng = random.Random(seed)
+    vivos = deque()
+    permanentes = []
+    heap = GenerationalCollector(generacion_joven, roots=lambda: chain(vivos, permanentes))
+    inicio = time.perf_counter()
+    for i in range(num_objetos):
+        previo = vivos[-1] if vivos and rng.random() < 0.5 else -1
+        addr = heap.allocate(i % 1000, i, previo)
+        vivos.append(addr)
+        if rng.random() < 0.01:
+            permanentes.append(addr)
+        if len(vivos) > ventana:
+            vivos.popleft()
+            heap.set_ref(vivos[0], -1)
+    duracion = time.perf_counter() - inicio
+    print(f"Heap con arreglos: {num_objetos / duracion:.0f} asignaciones/s, "
+          f"{heap.collections} colecciones en {heap.collection_time:.3f} s "
+          f"({heap.collection_time / max(heap.collections, 1) * 1e3:.2f} ms por colección)")
+    print(f"  {heap.promoted} promovidos, {heap.freed} liberados, "
+          f"{len(heap.robot_ids)} direcciones usadas")
+
+    random.seed(seed)
+    listas = ListGenerationalCollector(generacion_joven)
+    tiempo_gc = 0.0
+    colecciones = 0
+    inicio = time.perf_counter()
+    for i in range(num_objetos):
+        listas.allocate(i % 1000, i)
+        if len(listas.young_generation) >= generacion_joven:
+            inicio_gc = time.perf_counter()
+            listas.collect_young()
+            tiempo_gc += time.perf_counter() - inicio_gc
+            colecciones += 1
+    duracion = time.perf_counter() - inicio
+    print(f"Versión con listas: {num_objetos / duracion:.0f} asignaciones/s, "
+          f"{colecciones} colecciones en {tiempo_gc:.3f} s "
+          f"({tiempo_gc / max(colecciones, 1) * 1e3:.2f} ms por colección)")
+
+def benchmark_instantanea(num_robots=10000, vecinos_por_robot=8):
+    # Mide el tiempo de una instantánea global y los mensajes en tránsito máximos
+    sistema = SistemaCoordinacion(num_robots, 0, vecinos_por_robot, verbose=False)
+    inicio = time.perf_counter()
+    sistema.tomar_instantanea()
+    duracion = time.perf_counter() - inicio
+    print(f"Robots: {num_robots}, vecinos por robot: {vecinos_por_robot}")
+    print(f"Duración de la instantánea: {duracion:.3f} s")
+    print(f"Máximo de mensajes en tránsito: {sistema.transporte.max_in_flight}")
+    print(f"Tamaño del registro de instantáneas: {sistema.instantaneas.log.file.tell()} bytes")
+
+def benchmark_relojes(num_robots=10000, num_tareas=20000, vecinos_por_robot=8, seed=0):
+    # Relojes densos frente a dispersos/diferenciales: entradas enviadas por mensaje,
+    # memoria del sistema, tiempo de las tareas y de una instantánea
+    for dispersos in (False, True):
+        random.seed(seed)
+        tracemalloc.start()
+        sistema = SistemaCoordinacion(num_robots, 0, vecinos_por_robot, verbose=False,
+                                      relojes_dispersos=dispersos, seed=seed)
+        inicio = time.perf_counter()
+        for _ in range(num_tareas):
+            sistema.ejecutar_tarea(random.randrange(num_robots))
+        duracion = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        sistema.tomar_instantanea()
+        instantanea = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[0]  # Todo el sistema, no solo los relojes
+        tracemalloc.stop()
+        contadores = sistema.metrics.counters
+        print(f"Relojes {'dispersos' if dispersos else 'densos'}: "
+              f"{contadores['clock_entries_sent'] / contadores['messages_sent']:.1f} entradas por mensaje, "
+              f"memoria {memoria / 2 ** 20:.1f} MiB, {num_tareas / duracion:.0f} tareas/s, "
+              f"instantánea {instantanea:.2f} s")
+
+def benchmark_traza(num_robots=200, num_tareas=5000, vecinos_por_robot=8, checkpoint_every=1000, seed=0):
+    # Ejecución registrada frente a su reproducción completa y a saltos a tareas concretas
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, 'ejecucion.trace')
+        sistema = SistemaCoordinacion(num_robots, num_tareas, vecinos_por_robot, verbose=False,
+                                      relojes_dispersos=True, seed=seed, traza=ruta,
+                                      checkpoint_every=checkpoint_every)
+        inicio = time.perf_counter()
+        sistema.ejecutar_tareas()
+        en_vivo = time.perf_counter() - inicio
+        sistema.cerrar()
+
+        replay = TraceReplay(ruta)
+        inicio = time.perf_counter()
+        estado = replay.replay(ReplayState(num_robots))  # Desde el principio, sin puntos de control
+        completa = time.perf_counter() - inicio
+        iguales = (estado.states == [robot.state for robot in sistema.robots]
+                   and estado.clocks == [robot.vector_clock.clock for robot in sistema.robots])
+        rng = random.Random(seed)
+        objetivos = [rng.randrange(num_tareas) for _ in range(20)]
+        inicio = time.perf_counter()
+        for objetivo in objetivos:
+            replay.seek(objetivo)
+        salto = (time.perf_counter() - inicio) / len(objetivos)
+        print(f"Tareas: {num_tareas}, traza: {os.path.getsize(ruta) / 1024:.0f} KiB, "
+              f"en vivo: {en_vivo:.2f} s, reproducción completa: {completa:.3f} s "
+              f"({en_vivo / completa:.0f}x), salto medio a una tarea: {salto * 1e3:.1f} ms, "
+              f"estado final idéntico: {iguales}")
+        replay.close()
+
+def benchmark_metricas(num_robots=100, num_tareas=2000, seed=0):
+    # Compara el costo de una ejecución con impresión por paso frente a una silenciosa
+    # con métricas, y vuelca las métricas en formato Prometheus
+    sistema = SistemaCoordinacion(num_robots, num_tareas, vecinos_por_robot=8, seed=seed)
+    with open(os.devnull, 'w') as salida, contextlib.redirect_stdout(salida):
+        inicio = time.perf_counter()
+        sistema.ejecutar_tareas()
+        con_impresion = time.perf_counter() - inicio
+
+    sistema = SistemaCoordinacion(num_robots, num_tareas, vecinos_por_robot=8, verbose=False, seed=seed)
+    sistema.metrics.start_profiler()
+    inicio = time.perf_counter()
+    sistema.ejecutar_tareas()
+    silenciosa = time.perf_counter() - inicio
+    sistema.metrics.stop_profiler()
+    print(f"Tareas: {num_tareas}, con impresión: {con_impresion:.3f} s, silenciosa: {silenciosa:.3f} s")
+    for (archivo, linea, funcion), muestras in sistema.metrics.samples.most_common(3):
+        print(f"  {muestras} muestras en {funcion} ({os.path.basename(archivo)}:{linea})")
+    print(sistema.metrics.to_prometheus(), end="")
+
+def benchmark_concurrencia(num_robots=100, num_tareas=2000, trabajo=0.001, instantanea_cada=20,
+                           trabajadores=(1, 4, 16), seed=0):
+    # Rendimiento de ejecutar_tareas frente a ejecutar_tareas_concurrentes cuando cada
+    # tarea trabaja `trabajo` segundos fuera de la sección crítica; comprueba además que
+    # las instantáneas tomadas con tareas en curso sean cortes consistentes
+    def medir(nombre, ejecutar, sistema):
+        inicio = time.perf_counter()
+        ejecutar()
+        duracion = time.perf_counter() - inicio
+        en_canales = inconsistentes = 0
+        for _, estados in sistema.instantaneas.log.replay():
+            for estado in estados.values():
+                en_canales += sum(len(deltas) for deltas in estado['channels'].values())
+                # Ningún robot puede conocer más eventos de otro que el propio robot
+                for i, valor in estado['clock'].items():
+                    if valor > estados[i]['clock'].get(i, 0):
+                        inconsistentes += 1
+        print(f"{nombre}: {num_tareas / duracion:.0f} tareas/s, "
+              f"{sistema.instantaneas.completed} instantáneas con {en_canales} mensajes en canales, "
+              f"cortes inconsistentes: {inconsistentes}")
+        sistema.cerrar()
+        return duracion
+
+    def sistema_nuevo():
+        return SistemaCoordinacion(num_robots, num_tareas, vecinos_por_robot=8, verbose=False,
+                                   relojes_dispersos=True, seed=seed, trabajo=trabajo)
+
+    sistema = sistema_nuevo()
+    serie = medir("En serie", lambda: sistema.ejecutar_tareas(instantanea_cada), sistema)
+    for num_trabajadores in trabajadores:
+        sistema = sistema_nuevo()
+        duracion = medir(f"Concurrente, {num_trabajadores} hilos",
+                         lambda: sistema.ejecutar_tareas_concurrentes(num_trabajadores, instantanea_cada),
+                         sistema)
+        print(f"  aceleración frente a la ejecución en serie: {serie / duracion:.1f}x")
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_raymond()
+        benchmark_raymond(num_robots=10000, num_hilos=8)
+        benchmark_instantanea()
+        benchmark_gc()
+        benchmark_metricas()
+        benchmark_relojes()
+        benchmark_traza()
+        benchmark_concurrencia()
+    else:
+        main()
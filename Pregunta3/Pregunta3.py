@@ -1,11 +1,26 @@
+import bisect
+import contextlib
+import heapq
+import math
+import multiprocessing
+import os
 import time
 import random
+import struct
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metricas import Metrics
 
 class Message:
-    def __init__(self, sender, content, timestamp):
+    __slots__ = ('sender', 'content', 'timestamp', 'data')
+
+    def __init__(self, sender, content, timestamp, data=None):
         self.sender = sender
         self.content = content
         self.timestamp = timestamp
+        self.data = data  # Datos adicionales del protocolo (p. ej. sincronización de relojes)
 
 class Node:
     def __init__(self, node_id, total_nodes, network):
@@ -13,16 +28,33 @@ class Node:
         self.total_nodes = total_nodes
         self.network = network
         self.clock = random.randint(0, 30)  # Inicializa el reloj con un tiempo aleatorio
+        # Reloj físico simulado: valor en clock_base_time y tasa de avance respecto al
+        # tiempo simulado (la deriva la fija la red); parte del mismo desfase aleatorio
+        self.clock_base_time = network.now
+        self.clock_base_value = float(self.clock)
+        self.nominal_rate = network.clock_rate()
+        self.clock_rate = self.nominal_rate
+        self.slew_end = None  # Fin del frenado en curso (ajuste negativo)
+        self.sync = ClockSync(self, network.sync_fanout)
         self.mutex = RicartAgrawalaMutex(self)  # Crea el objeto para manejar la exclusión mutua
-        self.collector = CheneyCollector(10)  # Crea el recolector de basura
-        self.parent = None  # Para el algoritmo Dijkstra-Scholten
-        self.children = set()  # Para el algoritmo Dijkstra-Scholten
-        self.active = True  # Indica si el nodo está activo
+        self.roots = []  # Direcciones raíz del heap del nodo
+        self.collector = CheneyCollector(network.heap_size, self.roots, network.metrics)  # Crea el recolector de basura
+        # Dijkstra-Scholten: el padre es quien activó al nodo por primera vez (árbol dinámico)
+        self.engaged = False  # Forma parte del árbol de la computación difusa
+        self.parent = None
+        self.in_deficits = {}  # Emisor -> mensajes básicos recibidos aún no señalados
+        self.out_deficit = 0  # Mensajes básicos enviados cuya señal aún no llegó
+        self.unsignaled = False  # Hay déficits de aristas no-padre pendientes de señalar
+        self.spread = False  # Ya propagó la activación a sus destinos
+        self.basic_sent = 0
+        self.signals_sent = 0
+        self.signals_received = 0
+        self.active = False  # Indica si el nodo está activo
 
-    def send_message(self, recipient_id, content):
+    def send_message(self, recipient_id, content, data=None):
         # Envía un mensaje a otro nodo
         if recipient_id is not None and 0 <= recipient_id < self.total_nodes:
-            message = Message(self.node_id, content, self.clock)
+            message = Message(self.node_id, content, self.clock, data)
             self.network.deliver_message(recipient_id, message)
         else:
             print(f"Invalid recipient_id: {recipient_id}")
@@ -33,12 +65,20 @@ class Node:
             print(f"Node {self.node_id} received None message")
             return
         self.clock = max(self.clock, message.timestamp) + 1  # Actualiza el reloj lógico
-        if message.content == "TERMINATE":
-            self.receive_termination(message.sender)
+        if message.content == "ACTIVATE":
+            self.receive_activation(message.sender)
+        elif message.content == "SIGNAL":
+            self.receive_signal(message.data)
         elif message.content == "REQUEST":
-            self.mutex.receive_request(message.sender)
+            self.mutex.receive_request(message.sender, message.timestamp)
         elif message.content == "REPLY":
             self.mutex.receive_reply()
+        elif message.content == "SYNC_REQUEST":
+            self.sync.receive_request(message.data)
+        elif message.content == "SYNC_REPORT":
+            self.sync.receive_report(message.sender, message.data)
+        elif message.content == "SYNC_ADJUST":
+            self.sync.receive_adjust(message.data)
 
     def request_mutex(self):
         # Solicita acceso a la sección crítica
@@ -48,145 +88,590 @@ class Node:
         # Libera la sección crítica
         self.mutex.leave_critical_section()
 
-    def receive_termination(self, child_id):
-        # Maneja la recepción de un mensaje de terminación (Dijkstra-Scholten)
-        if child_id in self.children:
-            self.children.remove(child_id)
-        if not self.active and not self.children:
-            if self.parent is not None:
-                self.send_message(self.parent, "TERMINATE")
-            else:
-                print(f"Node {self.node_id} detected global termination")
+    def send_basic(self, recipient_id, content):
+        # Mensaje de la computación difusa: queda en deuda hasta recibir su señal
+        self.out_deficit += 1
+        self.basic_sent += 1
+        self.send_message(recipient_id, content)
+
+    def receive_activation(self, sender_id):
+        # Cuenta el mensaje en el déficit de su arista; el primero fija el padre
+        self.in_deficits[sender_id] = self.in_deficits.get(sender_id, 0) + 1
+        if not self.engaged:
+            self.engaged = True
+            self.parent = sender_id
+        elif sender_id != self.parent:
+            self.unsignaled = True  # Se señala en lote al terminar de procesar la bandeja
+        if not self.active:
+            self.start_process()
 
-    def synchronize_clock(self, master_time):
-        # Sincroniza el reloj del nodo con el tiempo maestro
-        self.clock = master_time
+    def receive_signal(self, count):
+        # Una señal agrupa `count` mensajes básicos ya contabilizados por el receptor
+        self.signals_received += 1
+        self.out_deficit -= count
+        self.try_detach()
+
+    def flush_signals(self):
+        # Señales en lote: una por arista no-padre con el total acumulado en ella
+        parent_deficit = self.in_deficits.pop(self.parent, 0) if self.parent is not None else 0
+        for sender_id, count in self.in_deficits.items():
+            self.signals_sent += 1
+            self.send_message(sender_id, "SIGNAL", count)
+        self.in_deficits.clear()
+        if parent_deficit:
+            self.in_deficits[self.parent] = parent_deficit
+        self.unsignaled = False
+
+    def try_detach(self):
+        # Un nodo pasivo sin deuda pendiente abandona el árbol señalando a su padre;
+        # cuando le ocurre a la raíz, la computación terminó
+        if self.active or self.out_deficit or not self.engaged:
+            return
+        self.flush_signals()
+        self.engaged = False
+        if self.parent is None:
+            self.network.termination_detected(self.node_id)
+            return
+        self.signals_sent += 1
+        self.send_message(self.parent, "SIGNAL", self.in_deficits.pop(self.parent))
+        self.parent = None
+
+    def physical_clock(self):
+        # Lectura del reloj físico en el tiempo simulado actual
+        now = self.network.now
+        if self.slew_end is not None and now >= self.slew_end:
+            # Terminó el frenado: el reloj vuelve a su tasa nominal
+            self.clock_base_value += self.clock_rate * (self.slew_end - self.clock_base_time)
+            self.clock_base_time = self.slew_end
+            self.clock_rate = self.nominal_rate
+            self.slew_end = None
+        return self.clock_base_value + self.clock_rate * (now - self.clock_base_time)
+
+    def adjust_clock(self, delta):
+        # Ajuste monótono: un reloj atrasado salta hacia adelante; uno adelantado nunca
+        # retrocede, se frena hasta absorber el ajuste. Reemplaza a cualquier frenado previo
+        now = self.network.now
+        self.clock_base_value = self.physical_clock()
+        self.clock_base_time = now
+        self.clock_rate = self.nominal_rate
+        self.slew_end = None
+        if delta >= 0:
+            self.clock_base_value += delta
+        else:
+            self.clock_rate = self.nominal_rate * (1 - ClockSync.SLEW)
+            self.slew_end = now - delta / (self.nominal_rate * ClockSync.SLEW)
+        # El reloj de Lamport solo avanza
+        self.clock = max(self.clock, int(self.physical_clock()))
+
+    def start_clock_sync(self):
+        # Solo la raíz del árbol de sincronización inicia rondas
+        if self.sync.parent is None:
+            self.sync.start_round()
 
     def collect_garbage(self):
         # Realiza la recolección de basura
         addr = self.collector.allocate(f"obj{self.node_id}")
-        print(f"Asignado obj{self.node_id} en: {addr}")
+        self.roots[:] = [addr]  # Solo el objeto más reciente permanece vivo
+        if self.network.verbose:
+            print(f"Asignado obj{self.node_id} en: {addr}")
         self.collector.collect()
-        print(f"Recoleccion de basura completa en Nodo {self.node_id}")
+        if self.network.verbose:
+            print(f"Recoleccion de basura completa en Nodo {self.node_id}")
 
     def start_process(self):
-        # Inicia el proceso del nodo
+        # Inicia el proceso del nodo; llamado sin mensaje de activación, el nodo es la
+        # raíz de la computación difusa. En su primera activación la propaga a sus destinos
+        self.engaged = True
         self.active = True
-        if self.parent is None and self.node_id != 0:
-            self.parent = 0
-            self.send_message(0, "ACTIVATE")
+        network = self.network
+        if not self.spread:
+            self.spread = True
+            for target in network.activation_targets(self.node_id):
+                self.send_basic(target, "ACTIVATE")
+        if network.work_time is not None:
+            network.schedule(network.rng.expovariate(1.0 / network.work_time), self.finish_process)
 
     def finish_process(self):
         # Finaliza el proceso del nodo
-        self.active = False
-        if not self.children:
-            if self.parent is not None:
-                self.send_message(self.parent, "TERMINATE")
-            else:
-                print(f"Node {self.node_id} finished process")
+        if self.active:
+            self.active = False
+            self.network.last_finish = max(self.network.last_finish, self.network.now)
+        self.try_detach()
 
 class RicartAgrawalaMutex:
-    def __init__(self, node):
+    def __init__(self, node, cs_duration=1.0):
         self.node = node
+        self.cs_duration = cs_duration  # Tiempo simulado que dura la sección crítica
         self.requesting = False
+        self.in_cs = False
+        self.request_timestamp = None
+        self.requested_at = None  # Tiempo simulado de la solicitud en curso
         self.replies_received = 0
+        self.deferred = set()  # Nodos cuya respuesta se aplaza hasta salir de la sección crítica
+        self.pending_requests = 0  # Solicitudes locales en espera de la actual
+        self.entries = 0
 
     def request_access(self):
-        # Solicita acceso a la sección crítica
+        # Solicita acceso a la sección crítica con una marca de tiempo de Lamport
+        if self.requesting or self.in_cs:
+            self.pending_requests += 1
+            return
         self.requesting = True
+        self.requested_at = self.node.network.now
         self.replies_received = 0
+        self.node.clock += 1
+        self.request_timestamp = self.node.clock
         for i in range(self.node.total_nodes):
             if i != self.node.node_id:
                 self.node.send_message(i, "REQUEST")
         self.check_enter_cs()
 
-    def receive_request(self, sender_id):
-        # Maneja la recepción de una solicitud de acceso
-        if not self.requesting or sender_id < self.node.node_id:
+    def receive_request(self, sender_id, timestamp):
+        # Responde de inmediato salvo que esta solicitud tenga prioridad (menor marca, luego menor id)
+        if self.in_cs or (self.requesting and
+                          (self.request_timestamp, self.node.node_id) < (timestamp, sender_id)):
+            self.deferred.add(sender_id)
+        else:
             self.node.send_message(sender_id, "REPLY")
-        # else: defer the reply
 
     def receive_reply(self):
         # Maneja la recepción de una respuesta
-        self.replies_received += 1
-        self.check_enter_cs()
+        if self.requesting:
+            self.replies_received += 1
+            self.check_enter_cs()
 
     def check_enter_cs(self):
         # Verifica si se puede entrar a la sección crítica
-        if self.replies_received == self.node.total_nodes - 1:
+        if self.requesting and self.replies_received == self.node.total_nodes - 1:
             self.enter_critical_section()
 
     def enter_critical_section(self):
-        # Entra a la sección crítica
-        print(f"Nodo {self.node.node_id} ingresando a la seccion critica")
-        time.sleep(1)
-        self.leave_critical_section()
+        # Entra a la sección crítica; la salida se programa en tiempo simulado
+        self.requesting = False
+        self.in_cs = True
+        self.entries += 1
+        network = self.node.network
+        # Espera medida en tiempo simulado, no en segundos reales
+        network.metrics.observe('mutex_wait_simulated', network.now - self.requested_at)
+        if network.verbose:
+            print(f"Nodo {self.node.node_id} ingresando a la seccion critica")
+        network.schedule(self.cs_duration, self.leave_critical_section)
 
     def leave_critical_section(self):
-        # Sale de la sección crítica
-        self.requesting = False
-        print(f"Nodo {self.node.node_id} dejando la seccion critica")
-        for i in range(self.node.total_nodes):
-            if i != self.node.node_id:
-                self.node.send_message(i, "REPLY")
+        # Sale de la sección crítica y responde solo a las solicitudes aplazadas
+        self.in_cs = False
+        if self.node.network.verbose:
+            print(f"Nodo {self.node.node_id} dejando la seccion critica")
+        for i in sorted(self.deferred):
+            self.node.send_message(i, "REPLY")
+        self.deferred.clear()
+        if self.pending_requests:
+            self.pending_requests -= 1
+            self.request_access()
+
+class ClockSync:
+    # Sincronización de relojes tipo Berkeley sobre un árbol k-ario fijo (padre de i es
+    # (i - 1) // k): la raíz difunde una solicitud, cada subárbol agrega la suma de los
+    # desfases de sus nodos respecto a su raíz, y la raíz difunde de vuelta el ajuste
+    # hacia el promedio. Cada desfase padre-hijo se estima como en NTP con cuatro
+    # lecturas (envío y recepción de la solicitud y del informe), compensando el retardo
+    # de ida y vuelta y el tiempo que el hijo esperó a su subárbol. Una ronda usa
+    # 3 (N - 1) mensajes y tiene profundidad O(log_k N)
+    SLEW = 0.5  # Fracción en que se frena un reloj adelantado mientras absorbe su ajuste
+
+    def __init__(self, node, fanout):
+        self.node = node
+        i, n = node.node_id, node.total_nodes
+        self.parent = (i - 1) // fanout if i > 0 else None
+        self.children = range(fanout * i + 1, min(fanout * (i + 1), n - 1) + 1)
+        self.round = 0
+        self.received_at = None  # Lectura local al recibir la solicitud del padre
+        self.sent_at = None  # Lectura local al reenviar la solicitud a los hijos
+        self.pending = 0  # Informes de hijos aún no recibidos
+        self.offset_sum = 0.0  # Suma de desfases del subárbol respecto a este nodo
+        self.count = 1  # Nodos del subárbol
+        self.child_offsets = {}  # Hijo -> desfase estimado (reloj del hijo - reloj propio)
+        self.last_adjustment = 0.0
+        self.rounds_completed = 0
+
+    def start_round(self):
+        self.round += 1
+        self.begin()
+
+    def begin(self):
+        self.offset_sum = 0.0
+        self.count = 1
+        self.child_offsets = {}
+        self.pending = len(self.children)
+        if not self.pending:
+            self.report()
+            return
+        self.sent_at = self.node.physical_clock()
+        for child in self.children:
+            self.node.send_message(child, "SYNC_REQUEST", (self.round,))
+
+    def receive_request(self, data):
+        (self.round,) = data
+        self.received_at = self.node.physical_clock()
+        self.begin()
+
+    def report(self):
+        if self.parent is None:
+            # Raíz: el objetivo es el promedio de todos los relojes
+            self.apply(self.offset_sum / self.count)
+            return
+        self.node.send_message(self.parent, "SYNC_REPORT",
+                               (self.round, self.received_at, self.node.physical_clock(),
+                                self.offset_sum, self.count))
+
+    def receive_report(self, child, data):
+        round_id, child_received, child_sent, offset_sum, count = data
+        if round_id != self.round:
+            return  # Informe de una ronda anterior
+        received = self.node.physical_clock()
+        offset = ((child_received - self.sent_at) + (child_sent - received)) / 2
+        self.child_offsets[child] = offset
+        self.offset_sum += offset_sum + count * offset  # Desfases del subárbol respecto a este nodo
+        self.count += count
+        self.pending -= 1
+        if not self.pending:
+            self.report()
+
+    def apply(self, adjustment):
+        # Ajusta el reloj propio y propaga a cada hijo su ajuste relativo
+        self.last_adjustment = adjustment
+        self.node.adjust_clock(adjustment)
+        for child in self.children:
+            self.node.send_message(child, "SYNC_ADJUST", (self.round, adjustment - self.child_offsets[child]))
+        self.rounds_completed += 1
+
+    def receive_adjust(self, data):
+        round_id, adjustment = data
+        if round_id == self.round:
+            self.apply(adjustment)
 
 class CheneyCollector:
-    def __init__(self, size):
-        self.size = size
-        self.from_space = [None] * size
-        self.to_space = [None] * size
-        self.free_ptr = 0
+    # Formato de cada objeto en el heap: cabecera (dirección de reenvío, número de
+    # referencias, bytes de datos), luego las referencias y por último los datos
+    HEADER = struct.Struct('<iHH')
+    REF = struct.Struct('<I')
+    NIL = 0xFFFFFFFF  # Referencia nula
+    NOT_FORWARDED = -1
+    MAX_FIELD = 0xFFFF  # Límite de los campos de la cabecera (número de referencias y de bytes)
+
+    def __init__(self, size, roots=None, metrics=None):
+        self.metrics = metrics  # Registra cada pausa como 'gc_pause_seconds'
+        self.size = size  # Tamaño de cada semiespacio en bytes
+        # Los semiespacios se reservan en la primera asignación o colección
+        self.from_space = None
+        self.to_space = None
+        self.free_ptr = 0  # Puntero de asignación (bump pointer)
+        self.roots = roots if roots is not None else []  # Direcciones raíz, actualizadas en cada colección
+        self.objects_allocated = 0
+        self.bytes_allocated = 0
+        self.collections = 0
+        self.total_pause = 0.0
+        self.max_pause = 0.0
+        self.bytes_before = 0  # Bytes ocupados antes de todas las colecciones
+        self.bytes_survived = 0  # Bytes copiados en todas las colecciones
+        self.created = time.perf_counter()
+
+    def reserve(self):
+        self.from_space = bytearray(self.size)
+        self.to_space = bytearray(self.size)
+
+    @classmethod
+    def object_size(cls, num_refs, num_bytes):
+        # Tamaño total alineado a 4 bytes
+        return (cls.HEADER.size + 4 * num_refs + num_bytes + 3) & ~3
 
-    def allocate(self, obj):
-        # Asigna un objeto en la memoria
-        if self.free_ptr >= self.size:
+    def allocate(self, obj, refs=()):
+        # Asigna un objeto en la memoria y devuelve su dirección
+        data = obj if isinstance(obj, bytes) else str(obj).encode('utf-8')
+        if len(data) > self.MAX_FIELD or len(refs) > self.MAX_FIELD:
+            raise ValueError(f"Objeto demasiado grande: {len(data)} bytes y {len(refs)} referencias "
+                             f"(máximo {self.MAX_FIELD} de cada uno)")
+        size = self.object_size(len(refs), len(data))
+        if self.from_space is None:
+            self.reserve()
+        if self.free_ptr + size > self.size:
             self.collect()
+            if self.free_ptr + size > self.size:
+                raise MemoryError(f"Heap lleno: {size} bytes no caben en {self.size - self.free_ptr} libres")
         addr = self.free_ptr
-        self.from_space[addr] = obj
-        self.free_ptr += 1
+        heap = self.from_space
+        self.HEADER.pack_into(heap, addr, self.NOT_FORWARDED, len(refs), len(data))
+        offset = addr + self.HEADER.size
+        for ref in refs:
+            self.REF.pack_into(heap, offset, self.NIL if ref is None else ref)
+            offset += 4
+        heap[offset:offset + len(data)] = data
+        self.free_ptr += size
+        self.objects_allocated += 1
+        self.bytes_allocated += size
         return addr
 
+    def read(self, addr):
+        # Devuelve los datos del objeto en la dirección indicada
+        _, num_refs, num_bytes = self.HEADER.unpack_from(self.from_space, addr)
+        offset = addr + self.HEADER.size + 4 * num_refs
+        return self.from_space[offset:offset + num_bytes].decode('utf-8')
+
+    def refs(self, addr):
+        # Devuelve las referencias del objeto (None para las nulas)
+        _, num_refs, _ = self.HEADER.unpack_from(self.from_space, addr)
+        offset = addr + self.HEADER.size
+        return [None if ref == self.NIL else ref
+                for ref in struct.unpack_from(f'<{num_refs}I', self.from_space, offset)]
+
+    def set_ref(self, addr, index, ref):
+        self.REF.pack_into(self.from_space, addr + self.HEADER.size + 4 * index,
+                           self.NIL if ref is None else ref)
+
     def collect(self):
-        # Realiza la recolección de basura
-        self.to_space = [None] * self.size
+        # Realiza la recolección de basura (Cheney): copia las raíces al otro semiespacio
+        # y recorre en anchura los objetos copiados actualizando sus referencias
+        inicio = time.perf_counter()
+        if self.from_space is None:
+            self.reserve()
+        used = self.free_ptr
         self.free_ptr = 0
-        for obj in self.from_space:
-            if obj is not None:
-                self.copy(obj)
+        copied = [None if addr is None else self.copy(addr) for addr in self.roots]
+        self.roots.clear()
+        self.roots.extend(copied)
+        to_space = self.to_space
+        header, ref_struct, nil = self.HEADER, self.REF, self.NIL
+        scan = 0
+        while scan < self.free_ptr:
+            _, num_refs, num_bytes = header.unpack_from(to_space, scan)
+            offset = scan + header.size
+            for _ in range(num_refs):
+                (ref,) = ref_struct.unpack_from(to_space, offset)
+                if ref != nil:
+                    ref_struct.pack_into(to_space, offset, self.copy(ref))
+                offset += 4
+            scan += self.object_size(num_refs, num_bytes)
         self.from_space, self.to_space = self.to_space, self.from_space
+        pausa = time.perf_counter() - inicio
+        self.collections += 1
+        self.total_pause += pausa
+        self.max_pause = max(self.max_pause, pausa)
+        if self.metrics is not None:
+            self.metrics.observe('gc_pause_seconds', pausa)
+        self.bytes_before += used
+        self.bytes_survived += self.free_ptr
 
     def copy(self, obj):
-        # Copia un objeto durante la recolección de basura
+        # Copia un objeto durante la recolección de basura, o devuelve su dirección
+        # de reenvío si ya fue copiado
+        from_space = self.from_space
+        forward, num_refs, num_bytes = self.HEADER.unpack_from(from_space, obj)
+        if forward != self.NOT_FORWARDED:
+            return forward
         addr = self.free_ptr
-        self.to_space[addr] = obj
-        self.free_ptr += 1
+        size = self.object_size(num_refs, num_bytes)
+        self.to_space[addr:addr + size] = memoryview(from_space)[obj:obj + size]
+        self.HEADER.pack_into(from_space, obj, addr, num_refs, num_bytes)
+        self.free_ptr += size
         return addr
 
+    def stats(self):
+        # Estadísticas de asignación, pausas y supervivencia
+        elapsed = time.perf_counter() - self.created
+        return {
+            'objects_allocated': self.objects_allocated,
+            'allocation_rate': self.objects_allocated / elapsed if elapsed else 0.0,
+            'bytes_allocated': self.bytes_allocated,
+            'collections': self.collections,
+            'total_pause': self.total_pause,
+            'mean_pause': self.total_pause / self.collections if self.collections else 0.0,
+            'max_pause': self.max_pause,
+            'survivor_ratio': self.bytes_survived / self.bytes_before if self.bytes_before else 0.0,
+        }
+
+# Modelos de latencia: devuelven el retardo (tiempo simulado) de cada mensaje
+# `lookahead` es el retardo mínimo garantizado, que usa la ejecución por particiones
+class ConstantDelay:
+    def __init__(self, delay=1.0):
+        self.delay = delay
+        self.lookahead = delay
+
+    def __call__(self, sender, recipient, rng):
+        return self.delay
+
+class UniformDelay:
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+        self.lookahead = low
+
+    def __call__(self, sender, recipient, rng):
+        return rng.uniform(self.low, self.high)
+
+class ExponentialDelay:
+    def __init__(self, mean):
+        self.mean = mean
+        self.lookahead = 0.0
+
+    def __call__(self, sender, recipient, rng):
+        return rng.expovariate(1.0 / self.mean)
+
+# Modelos de pérdida: indican si un mensaje se descarta
+class NoLoss:
+    def __call__(self, sender, recipient, rng):
+        return False
+
+class BernoulliLoss:
+    # Los algoritmos de esta red suponen canales fiables: usar solo para estudiar su efecto
+    def __init__(self, probability):
+        self.probability = probability
+
+    def __call__(self, sender, recipient, rng):
+        return rng.random() < self.probability
+
 class Network:
-    def __init__(self, num_nodes):
+    def __init__(self, num_nodes, delay=None, loss=None, seed=None, node_range=None,
+                 verbose=True, metrics=None, drift=0.0, sync_fanout=8,
+                 activation_fanout=8, extra_activations=0, work_time=None, heap_size=256):
         self.num_nodes = num_nodes
-        self.nodes = [Node(i, num_nodes, self) for i in range(num_nodes)]
+        self.heap_size = heap_size  # Bytes de cada semiespacio del recolector de un nodo
+        # Computación difusa: cada nodo activa a sus hijos en un árbol k-ario más
+        # extra_activations nodos al azar; con work_time los nodos pasan a pasivos solos
+        # tras un tiempo de trabajo exponencial de esa media
+        self.activation_fanout = activation_fanout
+        self.extra_activations = extra_activations
+        self.work_time = work_time
+        self.last_finish = 0.0  # Último instante en que un nodo pasó a pasivo
+        self.terminated_at = None  # Instante en que la raíz detectó la terminación
+        self.drift = drift  # Deriva máxima de los relojes físicos (p. ej. 1e-4)
+        self.sync_fanout = sync_fanout  # Grado del árbol de sincronización de relojes
+        self.verbose = verbose  # Con False no se imprime nada por cada evento
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Con node_range la red solo aloja los nodos [primero, último) de una partición
+        self.first_node, self.last_node = node_range if node_range is not None else (0, num_nodes)
+        self.rng = random.Random(seed)
+        self.delay = delay if delay is not None else ConstantDelay()
+        self.loss = loss if loss is not None else NoLoss()
+        self.now = 0.0  # Tiempo simulado
+        self.events = []  # Montículo de entregas pendientes (tiempo, secuencia, destino, mensaje)
+        self.sequence = 0
+        self.outbox = []  # Mensajes hacia nodos de otras particiones (tiempo, destino, mensaje)
+        self.messages_sent = 0
+        self.messages_delivered = 0
+        self.messages_dropped = 0
+        self.published = (0, 0, 0)  # Contadores ya volcados a las métricas
+        self.nodes = [Node(i, num_nodes, self) for i in range(self.first_node, self.last_node)]
+        self.inboxes = [deque() for _ in self.nodes]  # Bandeja de entrada por nodo local
 
     def deliver_message(self, recipient_id, message):
-        # Entrega un mensaje a un nodo específico
+        # Programa la entrega de un mensaje según los modelos de latencia y pérdida
         if recipient_id is not None and 0 <= recipient_id < self.num_nodes:
-            self.nodes[recipient_id].receive_message(message)
+            self.messages_sent += 1
+            if self.loss(message.sender, recipient_id, self.rng):
+                self.messages_dropped += 1
+                return
+            deliver_at = self.now + self.delay(message.sender, recipient_id, self.rng)
+            if self.first_node <= recipient_id < self.last_node:
+                self.enqueue(deliver_at, recipient_id, message)
+            else:
+                self.outbox.append((deliver_at, recipient_id, message))
         else:
             print(f"Invalid recipient_id: {recipient_id}")
 
+    def enqueue(self, deliver_at, recipient_id, message):
+        # Inserta una entrega en el montículo (los índices de las bandejas son locales)
+        self.sequence += 1
+        heapq.heappush(self.events, (deliver_at, self.sequence, recipient_id - self.first_node, message))
+
+    def activation_targets(self, node_id):
+        first = self.activation_fanout * node_id + 1
+        targets = list(range(first, min(first + self.activation_fanout, self.num_nodes)))
+        for _ in range(self.extra_activations):
+            target = self.rng.randrange(self.num_nodes)
+            if target != node_id:
+                targets.append(target)
+        return targets
+
+    def termination_detected(self, node_id):
+        self.terminated_at = self.now
+        self.metrics.inc('terminations_detected')
+        if self.verbose:
+            print(f"Node {node_id} detected global termination")
+
+    def clock_rate(self):
+        return 1.0 + self.rng.uniform(-self.drift, self.drift) if self.drift else 1.0
+
+    def next_event_time(self):
+        return self.events[0][0] if self.events else None
+
+    def schedule(self, delay, callback):
+        # Programa una llamada en tiempo simulado (temporizador local, no es un mensaje)
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, self.sequence, None, callback))
+
+    def run(self, until=None):
+        # Bucle de eventos discretos: en cada instante mueve a las bandejas todos los
+        # mensajes que vencen y luego cada nodo procesa su bandeja en lote
+        inicio = time.perf_counter()
+        events, inboxes, nodes = self.events, self.inboxes, self.nodes
+        while events and (until is None or events[0][0] <= until):
+            self.now = events[0][0]
+            ready = []
+            timers = []
+            while events and events[0][0] == self.now:
+                _, _, recipient_id, message = heapq.heappop(events)
+                if recipient_id is None:
+                    timers.append(message)
+                    continue
+                inbox = inboxes[recipient_id]
+                if not inbox:
+                    ready.append(recipient_id)
+                inbox.append(message)
+            for recipient_id in ready:
+                inbox = inboxes[recipient_id]
+                node = nodes[recipient_id]
+                self.messages_delivered += len(inbox)
+                while inbox:
+                    node.receive_message(inbox.popleft())
+                if node.unsignaled:
+                    node.flush_signals()
+            for callback in timers:
+                callback()
+        if until is not None:
+            self.now = max(self.now, until)
+        self.metrics.observe('run_seconds', time.perf_counter() - inicio)
+        self.publish_metrics()
+
+    def publish_metrics(self):
+        # Los contadores por mensaje ya existen: se vuelcan a las métricas solo lo nuevo
+        # desde la última publicación, en lugar de actualizarlas en cada mensaje
+        current = (self.messages_sent, self.messages_delivered, self.messages_dropped)
+        for name, value, previous in zip(('messages_sent', 'messages_delivered', 'messages_dropped'),
+                                         current, self.published):
+            self.metrics.inc(name, value - previous)
+        self.published = current
+
     def start(self):
         # Inicia la red
-        print("Starting the network")
+        if self.verbose:
+            print("Starting the network")
         self.synchronize_clocks()
-        for node in self.nodes:
-            node.start_process()
+        if self.first_node == 0:
+            self.nodes[0].start_process()  # El nodo 0 inicia la computación difusa
+        self.run()
 
     def synchronize_clocks(self):
-        # Sincroniza los relojes de todos los nodos
-        master_time = sum(node.clock for node in self.nodes) / len(self.nodes)
-        for node in self.nodes:
-            node.synchronize_clock(master_time)
-        print([(node.node_id, node.clock) for node in self.nodes])
+        # Ejecuta una ronda del protocolo de sincronización desde la raíz del árbol
+        if self.first_node == 0:
+            self.nodes[0].start_clock_sync()
+        self.run()
+        if self.verbose:
+            print([(node.node_id, round(node.physical_clock(), 2)) for node in self.nodes])
+
+    def clock_spread(self):
+        # Diferencia entre el reloj físico más adelantado y el más atrasado
+        clocks = [node.physical_clock() for node in self.nodes]
+        return max(clocks) - min(clocks)
 
     def simulate_scientific_task(self):
         # Simula la ejecución de tareas científicas
@@ -194,7 +679,8 @@ class Network:
         for _ in range(3):
             node = random.choice(self.nodes)
             node.request_mutex()
-        
+        self.run()
+
         # Realizar la recolección de basura en los nodos
         for node in self.nodes:
             node.collect_garbage()
@@ -205,11 +691,320 @@ class Network:
         # Finalizar procesos para detectar terminación
         for node in self.nodes:
             node.finish_process()
-
         # Esperar a que se detecte la terminación global
-        time.sleep(2)
+        self.run()
+
+def _shard_worker(conn, num_nodes, node_range, delay, loss, seed, verbose, options):
+    # Proceso trabajador: aloja una partición de nodos y atiende órdenes del coordinador
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+    random.seed(seed)
+    network = Network(num_nodes, delay, loss, seed, node_range, verbose, **options)
+    first = network.first_node
+    while True:
+        command, *args = conn.recv()
+        if command == 'step':
+            # Entrega los mensajes entrantes y avanza hasta justo antes del fin de la ventana
+            window_end, incoming = args
+            for deliver_at, recipient_id, message in incoming:
+                network.enqueue(deliver_at, recipient_id, message)
+            network.run(until=math.nextafter(window_end, -math.inf))
+        elif command == 'call':
+            # Llama a un método de los nodos indicados (None = todos los nodos locales)
+            method, node_ids = args
+            nodes = network.nodes if node_ids is None else [network.nodes[i - first] for i in node_ids]
+            for node in nodes:
+                getattr(node, method)()
+        elif command == 'apply':
+            function, function_args = args
+            function(network, *function_args)
+        elif command == 'clocks':
+            conn.send([node.physical_clock() for node in network.nodes])
+            continue
+        elif command == 'stats':
+            conn.send({'messages_sent': network.messages_sent,
+                       'messages_delivered': network.messages_delivered,
+                       'messages_dropped': network.messages_dropped,
+                       'cs_entries': sum(node.mutex.entries for node in network.nodes),
+                       'signals_sent': sum(node.signals_sent for node in network.nodes),
+                       'max_signals_received': max(node.signals_received for node in network.nodes),
+                       'terminations_detected': int(network.terminated_at is not None),
+                       'now': network.now})
+            continue
+        elif command == 'metrics':
+            network.publish_metrics()
+            conn.send(network.metrics.to_dict())
+            continue
+        elif command == 'stop':
+            conn.close()
+            return
+        outbox, network.outbox = network.outbox, []
+        conn.send((outbox, network.next_event_time()))
+
+class ShardedNetwork:
+    # Ejecuta una Network repartida en procesos: cada uno aloja un rango contiguo de nodos.
+    # La sincronización es conservadora por ventanas de tamaño `lookahead` (retardo mínimo):
+    # ningún mensaje entre particiones enviado dentro de una ventana puede vencer en ella.
+    # Las opciones adicionales (drift, sync_fanout, activation_fanout...) se pasan a cada Network
+    def __init__(self, num_nodes, num_shards=None, delay=None, loss=None, seed=None, verbose=True,
+                 **options):
+        self.num_nodes = num_nodes
+        self.verbose = verbose
+        self.num_shards = num_shards or os.cpu_count() or 1
+        delay = delay if delay is not None else ConstantDelay()
+        self.lookahead = getattr(delay, 'lookahead', 0.0)
+        if self.lookahead <= 0:
+            raise ValueError("La ejecución por particiones requiere un modelo de retardo con lookahead > 0")
+        self.bounds = [num_nodes * k // self.num_shards for k in range(self.num_shards + 1)]
+        self.connections = []
+        self.workers = []
+        for k in range(self.num_shards):
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_shard_worker,
+                args=(child, num_nodes, (self.bounds[k], self.bounds[k + 1]), delay, loss,
+                      None if seed is None else seed + k, verbose, options),
+                daemon=True)
+            worker.start()
+            self.connections.append(parent)
+            self.workers.append(worker)
+        self.incoming = [[] for _ in range(self.num_shards)]
+        self.next_times = [None] * self.num_shards
+        self.now = 0.0
+
+    def shard_of(self, node_id):
+        return bisect.bisect_right(self.bounds, node_id) - 1
+
+    def broadcast(self, commands):
+        # Envía una orden a cada partición y encamina los mensajes salientes que devuelven
+        for conn, command in zip(self.connections, commands):
+            conn.send(command)
+        for k, conn in enumerate(self.connections):
+            outbox, self.next_times[k] = conn.recv()
+            for deliver_at, recipient_id, message in outbox:
+                self.incoming[self.shard_of(recipient_id)].append((deliver_at, recipient_id, message))
+
+    def call(self, method, node_ids=None):
+        # Llama a un método de Node en los nodos indicados (None = todos)
+        if node_ids is None:
+            self.broadcast([('call', method, None)] * self.num_shards)
+            return
+        por_particion = [[] for _ in range(self.num_shards)]
+        for node_id in node_ids:
+            por_particion[self.shard_of(node_id)].append(node_id)
+        self.broadcast([('call', method, ids) for ids in por_particion])
+
+    def apply(self, function, *args):
+        # Ejecuta function(red_local, *args) en cada partición
+        self.broadcast([('apply', function, args)] * self.num_shards)
+
+    def run(self):
+        # Avanza ventana a ventana hasta que no quedan eventos ni mensajes en tránsito
+        # (detección de terminación global en la barrera de cada ventana)
+        while True:
+            times = [t for t in self.next_times if t is not None]
+            times.extend(deliver_at for batch in self.incoming for deliver_at, _, _ in batch)
+            if not times:
+                return
+            window_end = min(times) + self.lookahead
+            incoming, self.incoming = self.incoming, [[] for _ in range(self.num_shards)]
+            self.broadcast([('step', window_end, batch) for batch in incoming])
+            self.now = window_end
+
+    def start(self):
+        if self.verbose:
+            print("Starting the network")
+        self.synchronize_clocks()
+        self.call('start_process', [0])
+        self.run()
+
+    def synchronize_clocks(self):
+        # El protocolo viaja como mensajes entre particiones; el coordinador solo avanza ventanas
+        self.call('start_clock_sync', [0])
+        self.run()
+
+    def clock_spread(self):
+        for conn in self.connections:
+            conn.send(('clocks',))
+        clocks = [clock for conn in self.connections for clock in conn.recv()]
+        return max(clocks) - min(clocks)
+
+    def simulate_scientific_task(self):
+        self.call('request_mutex', random.sample(range(self.num_nodes), min(3, self.num_nodes)))
+        self.run()
+        self.call('collect_garbage')
+        self.synchronize_clocks()
+        self.call('finish_process')
+        self.run()
+
+    def stats(self):
+        for conn in self.connections:
+            conn.send(('stats',))
+        totals = {}
+        for conn in self.connections:
+            for key, value in conn.recv().items():
+                if key in ('now', 'max_signals_received'):
+                    totals[key] = max(totals.get(key, 0), value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def metrics(self):
+        # Agrega las métricas de todas las particiones
+        metrics = Metrics()
+        for conn in self.connections:
+            conn.send(('metrics',))
+        for conn in self.connections:
+            metrics.merge(conn.recv())
+        return metrics
+
+    def close(self):
+        for conn in self.connections:
+            conn.send(('stop',))
+        for worker in self.workers:
+            worker.join()
+
+def _generar_trafico(network, mensajes_por_nodo, seed):
+    # Cada nodo local envía mensajes PING a nodos aleatorios de toda la red
+    rng = random.Random(seed + network.first_node)
+    for node in network.nodes:
+        for _ in range(mensajes_por_nodo):
+            node.send_message(rng.randrange(network.num_nodes), "PING")
+
+def benchmark_particiones(num_nodos=100000, mensajes_por_nodo=10, particiones=(1, 2, 4, 8), seed=0):
+    # Compara el tiempo de simulación de la misma carga con distinto número de procesos
+    base = None
+    for num_shards in particiones:
+        red = ShardedNetwork(num_nodos, num_shards, delay=UniformDelay(0.5, 1.5), seed=seed, verbose=False)
+        inicio = time.perf_counter()
+        red.apply(_generar_trafico, mensajes_por_nodo, seed)
+        red.run()
+        duracion = time.perf_counter() - inicio
+        stats = red.stats()
+        red.close()
+        base = base or duracion
+        print(f"Particiones: {num_shards}, mensajes entregados: {stats['messages_delivered']}, "
+              f"tiempo: {duracion:.2f} s, aceleración: {base / duracion:.2f}x")
+
+def benchmark_cheney(num_objetos=1000000, tamano=8 << 20, ventana=10000, seed=0):
+    # Asigna num_objetos en una lista enlazada cuyos últimos `ventana` nodos siguen vivos
+    rng = random.Random(seed)
+    roots = deque()
+    collector = CheneyCollector(tamano, roots)
+    for i in range(num_objetos):
+        previo = roots[-1] if roots else None
+        addr = collector.allocate(b'x' * rng.randint(4, 32), (previo,))
+        roots.append(addr)
+        if len(roots) > ventana:
+            # El objeto más antiguo de la ventana deja de retener al resto de la cadena
+            collector.set_ref(roots[1], 0, None)
+            roots.popleft()
+    stats = collector.stats()
+    print(f"Objetos: {num_objetos}, semiespacio: {tamano} bytes")
+    print(f"Asignaciones por segundo: {stats['allocation_rate']:.0f}")
+    print(f"Colecciones: {stats['collections']}, pausa media: {stats['mean_pause'] * 1e3:.2f} ms, "
+          f"pausa máxima: {stats['max_pause'] * 1e3:.2f} ms")
+    print(f"Tasa de supervivencia: {stats['survivor_ratio']:.3f}")
+
+def benchmark_mutex(tamanos=(8, 32, 128, 512), seed=0):
+    # Todos los nodos solicitan la sección crítica a la vez; se mide el rendimiento
+    # en tiempo real y en tiempo simulado, y los mensajes por entrada
+    for num_nodos in tamanos:
+        network = Network(num_nodos, seed=seed, verbose=False)
+        inicio = time.perf_counter()
+        for node in network.nodes:
+            node.request_mutex()
+        network.run()
+        duracion = time.perf_counter() - inicio
+        entradas = sum(node.mutex.entries for node in network.nodes)
+        print(f"Nodos: {num_nodos}, entradas: {entradas}, "
+              f"entradas por segundo: {entradas / duracion:.0f}, "
+              f"entradas por unidad de tiempo simulado: {entradas / network.now:.3f}, "
+              f"mensajes por entrada: {network.messages_sent / entradas:.1f}")
+
+def benchmark_red(num_nodos=10000, mensajes_por_nodo=20, delay=None, seed=0):
+    # Mide los mensajes entregados por segundo (tiempo real) en una red grande
+    network = Network(num_nodos, delay=delay if delay is not None else UniformDelay(0.5, 1.5), seed=seed)
+    rng = random.Random(seed)
+    inicio = time.perf_counter()
+    for node in network.nodes:
+        for _ in range(mensajes_por_nodo):
+            node.send_message(rng.randrange(num_nodos), "PING")
+    network.run()
+    duracion = time.perf_counter() - inicio
+    print(f"Nodos: {num_nodos}, mensajes entregados: {network.messages_delivered}")
+    print(f"Mensajes por segundo: {network.messages_delivered / duracion:.0f}")
+    print(f"Tiempo simulado: {network.now:.2f}")
+
+def benchmark_sincronizacion(tamanos=(100, 1000, 10000, 50000), fanout=8, seed=0):
+    # Una ronda de sincronización: dispersión de relojes antes y después (una vez
+    # absorbidos los frenados), mensajes por nodo y duración en tiempo simulado
+    for num_nodos in tamanos:
+        random.seed(seed)
+        network = Network(num_nodos, delay=UniformDelay(0.5, 1.5), seed=seed, verbose=False,
+                          drift=1e-4, sync_fanout=fanout)
+        antes = network.clock_spread()
+        inicio = time.perf_counter()
+        network.synchronize_clocks()
+        duracion = time.perf_counter() - inicio
+        ronda = network.now
+        network.run(until=network.now + 2 * antes / ClockSync.SLEW)  # Deja terminar los frenados
+        print(f"Nodos: {num_nodos}, dispersión: {antes:.2f} -> {network.clock_spread():.3f}, "
+              f"mensajes por nodo: {network.messages_sent / num_nodos:.2f}, "
+              f"tiempo simulado de la ronda: {ronda:.2f}, tiempo real: {duracion:.2f} s")
+
+def benchmark_terminacion(tamanos=(1000, 10000, 100000), extra_activations=2, work_time=5.0, seed=0):
+    # Computación difusa desde el nodo 0 en la que cada nodo trabaja un tiempo aleatorio:
+    # mide las señales por mensaje básico, la carga máxima de señales sobre un nodo y el
+    # retraso de la detección respecto al último nodo en terminar
+    for num_nodos in tamanos:
+        random.seed(seed)
+        network = Network(num_nodos, delay=UniformDelay(0.5, 1.5), seed=seed, verbose=False,
+                          extra_activations=extra_activations, work_time=work_time)
+        inicio = time.perf_counter()
+        network.nodes[0].start_process()
+        network.run()
+        duracion = time.perf_counter() - inicio
+        basicos = sum(node.basic_sent for node in network.nodes)
+        senales = sum(node.signals_sent for node in network.nodes)
+        print(f"Nodos: {num_nodos}, mensajes básicos: {basicos}, señales: {senales} "
+              f"({senales / basicos:.2f} por mensaje), "
+              f"máximo de señales recibidas por un nodo: {max(node.signals_received for node in network.nodes)}, "
+              f"retraso de detección: {network.terminated_at - network.last_finish:.2f}, "
+              f"tiempo real: {duracion:.2f} s")
+
+def benchmark_metricas(num_nodos=200, repeticiones=20, seed=0):
+    # Compara la tarea científica con impresión por evento frente a la versión silenciosa
+    # con métricas, y vuelca las métricas agregadas en JSON
+    def ejecutar(verbose):
+        random.seed(seed)
+        metrics = Metrics()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            network = Network(num_nodos, seed=seed, verbose=verbose, metrics=metrics)
+            network.simulate_scientific_task()
+        return time.perf_counter() - inicio, metrics
+
+    with open(os.devnull, 'w') as salida, contextlib.redirect_stdout(salida):
+        con_impresion, _ = ejecutar(True)
+    silenciosa, metrics = ejecutar(False)
+    print(f"Nodos: {num_nodos}, con impresión: {con_impresion:.3f} s, silenciosa: {silenciosa:.3f} s")
+    resumen = metrics.to_dict()
+    for nombre, histograma in resumen['histograms'].items():
+        print(f"  {nombre}: {histograma['count']} observaciones, p50 {histograma['p50']:.6f}, "
+              f"p99 {histograma['p99']:.6f}")
+    print(f"  Contadores: {resumen['counters']}")
 
 if __name__ == "__main__":
-    network = Network(3)  # Crea una red con 3 nodos
-    network.start()  # Inicia la red
-    network.simulate_scientific_task()  # Simula la ejecución de tareas científicas
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        benchmark_cheney()
+        benchmark_red()
+        benchmark_mutex()
+        benchmark_particiones()
+        benchmark_metricas()
+        benchmark_sincronizacion()
+        benchmark_terminacion()
+    else:
+        network = Network(3)  # Crea una red con 3 nodos
+        network.start()  # Inicia la red
+        network.simulate_scientific_task()  # Simula la ejecución de tareas científicas
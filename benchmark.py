@@ -0,0 +1,165 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Fuera de Unix no se mide la memoria máxima
+    resource = None
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+for carpeta in ('Pregunta1', 'Pregunta2', 'Pregunta3'):
+    sys.path.insert(0, os.path.join(RAIZ, carpeta))
+
+from metricas import Metrics
+from Pregunta1 import EventPriority, NotebookSimulator
+from Pregunta2 import SistemaCoordinacion
+from Pregunta3 import Network
+
+# Banco de pruebas reproducible de los tres simuladores. Cada caso se ejecuta en un
+# proceso nuevo (memoria máxima aislada) con una semilla fija, y los resultados se
+# comparan con una línea base guardada:
+#   python benchmark.py          ejecuta, guarda RESULTADOS y compara con BASE
+#   python benchmark.py base     ejecuta y guarda los resultados como nueva línea base
+RESULTADOS = os.path.join(RAIZ, 'benchmark_resultados.json')
+BASE = os.path.join(RAIZ, 'benchmark_base.json')
+REPETICIONES = 3
+DURACION_MINIMA = 0.5  # Los casos cortos se repiten dentro del proceso hasta durar esto
+# Variación relativa admitida antes de marcar una regresión; la de p99 supera el ancho
+# de una cubeta del histograma (2 ** 0.25)
+TOLERANCIA = {'rendimiento': 0.15, 'p99': 0.25, 'memoria': 0.15}
+
+# (simulador, parámetros): el histograma principal aporta los percentiles de latencia
+CASOS = [
+    ('robots', {'num_robots': 10, 'num_tareas': 2000}),
+    ('robots', {'num_robots': 100, 'num_tareas': 2000}),
+    ('robots', {'num_robots': 1000, 'num_tareas': 400}),
+    ('red', {'num_nodos': 100}),
+    ('red', {'num_nodos': 1000}),
+    ('red', {'num_nodos': 10000}),
+    ('notebook', {'num_celdas': 100, 'num_eventos': 5000}),
+    ('notebook', {'num_celdas': 1000, 'num_eventos': 20000}),
+]
+
+def caso_robots(metrics, num_robots, num_tareas, seed):
+    # SistemaCoordinacion.ejecutar_tareas: tareas con mutex, GC e instantánea cada 2 tareas
+    sistema = SistemaCoordinacion(num_robots, num_tareas, vecinos_por_robot=8,
+                                  verbose=False, metrics=metrics, seed=seed)
+    sistema.ejecutar_tareas()
+    sistema.cerrar()
+    return num_tareas, 'task_seconds'
+
+def caso_red(metrics, num_nodos, seed):
+    # Network.simulate_scientific_task: Ricart-Agrawala, GC por nodo y terminación; la
+    # latencia es la de cada simulación completa
+    random.seed(seed)
+    network = Network(num_nodos, seed=seed, verbose=False, metrics=metrics)
+    inicio = time.perf_counter()
+    network.simulate_scientific_task()
+    metrics.observe('simulation_seconds', time.perf_counter() - inicio)
+    return network.messages_delivered, 'simulation_seconds'
+
+def caso_notebook(metrics, num_celdas, num_eventos, seed):
+    # NotebookSimulator.run con una carga aleatoria de ejecuciones y ediciones
+    rng = random.Random(seed)
+    eventos = [('add_cell', EventPriority.HIGH, f"x{i} = {i}") for i in range(num_celdas)]
+    for _ in range(num_eventos):
+        celda = rng.randrange(num_celdas)
+        if rng.random() < 0.8:
+            eventos.append(('execute_cell', EventPriority.MEDIUM, celda))
+        else:
+            eventos.append(('modify_cell', EventPriority.LOW, (celda, f"x{celda} = {rng.random()}")))
+    notebook = NotebookSimulator(num_workers=4, verbose=False, metrics=metrics)
+    asyncio.run(notebook.run(eventos))
+    notebook.close()
+    return notebook.events_processed, 'event_latency_seconds'
+
+CASOS_POR_NOMBRE = {'robots': caso_robots, 'red': caso_red, 'notebook': caso_notebook}
+
+def ejecutar_caso(nombre, parametros, seed):
+    # Se ejecuta en el proceso hijo; todas las pasadas usan la misma semilla
+    metrics = Metrics()
+    operaciones, duracion, pasadas = 0, 0.0, 0
+    while duracion < DURACION_MINIMA:
+        inicio = time.perf_counter()
+        hechas, principal = CASOS_POR_NOMBRE[nombre](metrics, seed=seed, **parametros)
+        duracion += time.perf_counter() - inicio
+        operaciones += hechas
+        pasadas += 1
+    histograma = metrics.histograms[principal]
+    return {
+        'operaciones': operaciones,
+        'pasadas': pasadas,
+        'duracion': duracion,
+        'rendimiento': operaciones / duracion,
+        'latencia': principal,
+        'p50': histograma.percentile(50),
+        'p90': histograma.percentile(90),
+        'p99': histograma.percentile(99),
+        # ru_maxrss está en KiB en Linux
+        'memoria_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+def clave(nombre, parametros):
+    return nombre + ' ' + ' '.join(f"{k}={v}" for k, v in sorted(parametros.items()))
+
+def ejecutar(seed=0):
+    # Repite cada caso en procesos nuevos y se queda con la mejor repetición: la
+    # interferencia de otros procesos solo puede empeorar los tiempos
+    contexto = multiprocessing.get_context('spawn')
+    resultados = {}
+    for nombre, parametros in CASOS:
+        repeticiones = []
+        for _ in range(REPETICIONES):
+            with contexto.Pool(1) as pool:
+                repeticiones.append(pool.apply(ejecutar_caso, (nombre, parametros, seed)))
+        resultado = max(repeticiones, key=lambda r: r['rendimiento'])
+        resultado['dispersion'] = (statistics.pstdev(r['rendimiento'] for r in repeticiones)
+                                   / resultado['rendimiento'])
+        resultados[clave(nombre, parametros)] = resultado
+        print(f"{clave(nombre, parametros)}: {resultado['rendimiento']:.0f} op/s, "
+              f"{resultado['latencia']} p50 {resultado['p50'] * 1e3:.3f} ms "
+              f"p99 {resultado['p99'] * 1e3:.3f} ms, memoria {resultado['memoria_kib']} KiB")
+    return resultados
+
+def comparar(resultados, base):
+    # Devuelve las regresiones: menos rendimiento, o más latencia p99 o memoria que la base
+    regresiones = []
+    for caso, actual in resultados.items():
+        anterior = base.get(caso)
+        if anterior is None:
+            continue
+        cambios = [('rendimiento', anterior['rendimiento'] / actual['rendimiento'] - 1),
+                   ('p99', actual['p99'] / anterior['p99'] - 1 if anterior['p99'] else 0.0)]
+        if actual['memoria_kib'] and anterior['memoria_kib']:
+            cambios.append(('memoria', actual['memoria_kib'] / anterior['memoria_kib'] - 1))
+        for metrica, cambio in cambios:
+            marca = ' REGRESIÓN' if cambio > TOLERANCIA[metrica] else ''
+            print(f"  {caso} {metrica}: {-cambio if metrica == 'rendimiento' else cambio:+.1%}{marca}")
+            if marca:
+                regresiones.append((caso, metrica, cambio))
+    return regresiones
+
+def main():
+    guardar_base = len(sys.argv) > 1 and sys.argv[1] == "base"
+    resultados = ejecutar()
+    with open(BASE if guardar_base else RESULTADOS, 'w') as archivo:
+        json.dump(resultados, archivo, indent=2)
+    if guardar_base or not os.path.exists(BASE):
+        print(f"Línea base guardada en {BASE}" if guardar_base else "No hay línea base para comparar")
+        return
+    with open(BASE) as archivo:
+        base = json.load(archivo)
+    print("\nComparación con la línea base:")
+    regresiones = comparar(resultados, base)
+    if regresiones:
+        print(f"{len(regresiones)} regresiones por encima de la tolerancia")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
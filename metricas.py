@@ -0,0 +1,157 @@
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+# Métricas de bajo costo compartidas por los tres simuladores: contadores,
+# histogramas con cubetas exponenciales y un perfilador por muestreo opcional
+
+# Límites superiores de las cubetas en segundos: de 1 us a ~67 s, cuatro cubetas por
+# cada duplicación (error relativo de los percentiles por debajo del 19 %)
+BUCKETS = tuple(1e-6 * 2 ** (i / 4) for i in range(105))
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # La última cubeta es +Inf
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, q):
+        # Estimación por el límite superior de la cubeta que contiene el percentil q
+        if not self.count:
+            return 0.0
+        objetivo = q / 100 * self.count
+        acumulado = 0
+        for i, n in enumerate(self.counts):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(BUCKETS[i], self.maximum) if i < len(BUCKETS) else self.maximum
+        return self.maximum
+
+    def merge(self, other):
+        for i, n in enumerate(other['counts']):
+            self.counts[i] += n
+        self.count += other['count']
+        self.total += other['sum']
+        self.maximum = max(self.maximum, other['max'])
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'max': self.maximum,
+                'p50': self.percentile(50), 'p99': self.percentile(99), 'counts': list(self.counts)}
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled  # Con False, inc/observe no hacen nada
+        self.counters = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self.lock = threading.Lock()  # Los robots de Pregunta2 actualizan desde varios hilos
+        self.samples = Counter()  # Perfilador: (archivo, línea, función) -> muestras
+        self.profiler = None
+
+    def inc(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def observe(self, name, value):
+        if self.enabled:
+            with self.lock:
+                self.histograms[name].observe(value)
+
+    def timer(self, name):
+        # Uso: with metrics.timer('nombre'): ...  (para rutas no críticas)
+        return _Timer(self, name)
+
+    def start_profiler(self, interval=0.005, thread_id=None):
+        # Muestrea periódicamente la pila del hilo indicado (por defecto el que llama)
+        if self.profiler is not None:
+            return
+        objetivo = thread_id if thread_id is not None else threading.get_ident()
+        detener = threading.Event()
+
+        def muestrear():
+            while not detener.wait(interval):
+                frame = sys._current_frames().get(objetivo)
+                if frame is not None:
+                    code = frame.f_code
+                    with self.lock:
+                        self.samples[(code.co_filename, frame.f_lineno, code.co_name)] += 1
+
+        hilo = threading.Thread(target=muestrear, daemon=True)
+        self.profiler = (hilo, detener)
+        hilo.start()
+
+    def stop_profiler(self):
+        if self.profiler is None:
+            return
+        hilo, detener = self.profiler
+        detener.set()
+        hilo.join()
+        self.profiler = None
+
+    def merge(self, other):
+        # Acumula un volcado de to_dict (p. ej. de un proceso de ShardedNetwork)
+        with self.lock:
+            for name, value in other['counters'].items():
+                self.counters[name] += value
+            for name, histogram in other['histograms'].items():
+                self.histograms[name].merge(histogram)
+            for (filename, line, function), n in other.get('samples', ()):
+                self.samples[(filename, line, function)] += n
+
+    def to_dict(self, top=20):
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+                    'samples': [(list(key), n) for key, n in self.samples.most_common(top)]}
+
+    def dump_json(self, path=None):
+        texto = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as archivo:
+                archivo.write(texto)
+        return texto
+
+    def to_prometheus(self, prefix='sim'):
+        # Formato de exposición de texto de Prometheus
+        lineas = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lineas.append(f"# TYPE {prefix}_{name}_total counter")
+                lineas.append(f"{prefix}_{name}_total {value}")
+            for name, h in sorted(self.histograms.items()):
+                lineas.append(f"# TYPE {prefix}_{name} histogram")
+                acumulado = 0
+                for limite, n in zip(BUCKETS, h.counts):
+                    acumulado += n
+                    lineas.append(f'{prefix}_{name}_bucket{{le="{limite:g}"}} {acumulado}')
+                lineas.append(f'{prefix}_{name}_bucket{{le="+Inf"}} {h.count}')
+                lineas.append(f"{prefix}_{name}_sum {h.total}")
+                lineas.append(f"{prefix}_{name}_count {h.count}")
+        return "\n".join(lineas) + "\n"
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'inicio')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.inicio)